@@ -15,7 +15,16 @@ import logging
 
 # import from custom scripts
 from CSV_Gen.save_data import ensure_dir, html_collection
+from CSV_Gen.http_client import HttpClient
+from CSV_Gen.sitemap_reader import gather_sitemap_urls
 from CSV_Gen.scraper_logic import listing_scraper, sitemap_scraper
+from CSV_Gen.page_fingerprint import TemplateStore
+from CSV_Gen.dom_minimizer import minimize_html
+from CSV_Gen.selector_validation import SelectorValidator, validate_selectors
+from CSV_Gen.url_clusters import cluster_urls, sample_clusters, cluster_selector_path, ClusterMap, PRODUCT, LISTING, SKIP
+from CSV_Gen.url_canon import unique_urls
+from CSV_Gen.extraction import compile_selectors
+from CSV_Gen.settings import REQUIRED_FIELDS
 logger = logging.getLogger("selector_discovery")
 
 HEADERS = {
@@ -28,27 +37,61 @@ HEADERS = {
 
 
 def validate_selector(soup, selector: str) -> str:
+    # single selector, prefer validate_selectors() for a whole selector set (one parse, shared counts)
     if not isinstance(selector, str):
         return ""
-    current = selector.strip()
+    return SelectorValidator(soup).best(selector)[0]
 
-    while True:
-        try:
-            if soup.select(current):
-                return current
-        except Exception:
-            pass
-
-        # no more scope to trim
-        if " " not in current:
-            break
 
-        # trim ONLY the leftmost scope
-        current = current.split(" ", 1)[1]
 
-    return ""
 
+async def llm_selectors(llm_cfg, selector_schema, prompt, url, html_content):
+    """
+    one llm selector run on the html we already have (no second browser render), schema-filled dict or None.
+    the html is minimized first, the model only needs the structure
+    """
+    llm_config = LLMConfig(
+        provider=llm_cfg["provider"],
+        api_token=llm_cfg["api_key"],
+        base_url=llm_cfg["base_url"]
+    )
 
+    llm_strategy = LLMExtractionStrategy(
+        llm_config=llm_config,
+        schema=selector_schema,
+        extraction_type="schema",
+        instruction=prompt,
+        input_format="html"
+    )
+
+    minimized = await asyncio.to_thread(minimize_html, html_content)
+    blocks = await llm_strategy.arun(url, [minimized])
+    blocks = [block for block in blocks or [] if isinstance(block, dict) and not block.get("error")]
+    if not blocks:
+        print("No extracted content received")
+        return None
+    selectors = blocks[0]
+
+    for key in selector_schema:
+        if key not in selectors or not isinstance(selectors[key], str):
+            selectors[key] = ""
+    return selectors
+
+
+def template_selectors(templates, kind, html_content, required):
+    """
+    selectors of a stored template with the same dom skeleton as this page (no llm call needed).
+    they are re-validated on this page, None when there is no match or a required field stopped matching
+    """
+    hit = templates.find(kind, html_content)
+    if not hit:
+        return None
+    selectors = validate_selectors(html_content, hit["selectors"])
+    if not all(selectors.get(field) for field in required):
+        logger.info(f"Template from {hit['url']} matched ({hit['score']:.2f}) but {required} no longer select anything")
+        return None
+    print(f"✓ Page matches a known {kind} template ({hit['score']:.0%}, learned on {hit['url']}), skipping the LLM")
+    return selectors
 
 
 def get_llm_config():
@@ -97,14 +140,17 @@ def get_llm_config():
 
 
 # from here onward you can add more function based on page strucutre 
-async def product_page(llm_cfg,html_content, url, base_dir):
+async def product_page(llm_cfg,html_content, url, base_dir, selector_path=None):
+    # returns the selectors (None when none could be made), saved to selector_path
+    # (default: selectors/<domain>/product_selector.json)
     if not html_content:
         print("No HTML content received, skipping selector extraction")
-        return
+        return None
     domain = urlparse(url).hostname or "unknown"
-    selectors_dir = os.path.join(base_dir, "selectors", domain)
-    ensure_dir(selectors_dir)
-    selector_path = os.path.join(selectors_dir, "product_selector.json")
+    if selector_path is None:
+        selectors_dir = os.path.join(base_dir, "selectors", domain)
+        selector_path = os.path.join(selectors_dir, "product_selector.json")
+    ensure_dir(os.path.dirname(selector_path))
     selector_schema = {
         "name": "",
         "price": "",
@@ -118,6 +164,15 @@ async def product_page(llm_cfg,html_content, url, base_dir):
         "size_container": ""
     }
 
+    # same template as a page the llm already saw -> reuse its selectors
+    templates = TemplateStore(base_dir, domain)
+    selectors = await asyncio.to_thread(template_selectors, templates, "product", html_content, ["name"])
+    if selectors is not None:
+        with open(selector_path, "w", encoding="utf-8") as f:
+            json.dump(selectors, f, indent=2, ensure_ascii=False)
+        print(f"Saved product selectors for {domain} at {selector_path}")
+        return selectors
+
     prompt = """
             You are an expert CSS selector engineer.
 
@@ -257,47 +312,9 @@ async def product_page(llm_cfg,html_content, url, base_dir):
 
         """
 
-    llm_config = LLMConfig(
-        provider=llm_cfg["provider"],
-        api_token=llm_cfg["api_key"],
-        base_url=llm_cfg["base_url"]
-    )
-
-    llm_strategy = LLMExtractionStrategy(
-        llm_config=llm_config,
-        schema=selector_schema,
-        extraction_type="schema",
-        instruction=prompt,
-        input_format="html"
-    )
-
-    browser_cfg = BrowserConfig(headless=True)
-    run_cfg = CrawlerRunConfig(
-        extraction_strategy=llm_strategy,
-        cache_mode=CacheMode.BYPASS
-    )
-    
-    async with AsyncWebCrawler(config=browser_cfg) as crawler:
-        result = await crawler.arun(url, config=run_cfg)
-    if not result or not result.extracted_content:
-        print("No extracted content received")
-        return
-    try: 
-        selectors = json.loads(result.extracted_content)
-        if isinstance(selectors, list):
-            if not selectors:
-                print("Empty selector list returned by LLM")
-                return
-            selectors = selectors[0]
-
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON: {e}")
-        print(f"Extracted content: {result.extracted_content}")
-        return
-
-    for key in selector_schema:
-        if key not in selectors or not isinstance(selectors[key], str):
-            selectors[key] = ""
+    selectors = await llm_selectors(llm_cfg, selector_schema, prompt, url, html_content)
+    if selectors is None:
+        return None
     headers = {
         "User-Agent": (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -306,19 +323,19 @@ async def product_page(llm_cfg,html_content, url, base_dir):
         ),
         "Accept-Language": "en-US,en;q=0.9"
     }
-    soup = BeautifulSoup(html_content, "html.parser")
+    # all fields in one pass, the candidate matching exactly once wins over a broader one
+    selectors = await asyncio.to_thread(validate_selectors, html_content, selectors)
 
-    for field, selector in selectors.items():
-        if not selector:
-            continue
-        selectors[field] = validate_selector(soup, selector)
-    
     with open(selector_path, "w", encoding="utf-8") as f:
         json.dump(selectors, f, indent=2, ensure_ascii=False)
-    print(f"Saved product selectors for {domain}")
+    templates.remember("product", html_content, selectors, url)
+    print(f"Saved product selectors for {domain} at {selector_path}")
+    return selectors
 # product page is use only for testing or generating single product page selectors from listing pages
 
-async def listing_page(llm_cfg, html_content, url, base_dir):
+async def listing_page(llm_cfg, html_content, url, base_dir, append=False):
+    # returns the number of product rows scraped (None when nothing was scraped),
+    # append=True keeps the rows an earlier scrape of this session wrote
     if not html_content:
         print("No HTML content received, skipping listing selector extraction")
         return
@@ -422,41 +439,16 @@ FINAL OUTPUT FORMAT (STRICT)
 }
     """
 
-    llm_config = LLMConfig(
-        provider=llm_cfg["provider"],
-        api_token=llm_cfg["api_key"],
-        base_url=llm_cfg["base_url"]
+    templates = TemplateStore(base_dir, domain)
+    selectors = await asyncio.to_thread(
+        template_selectors, templates, "listing", html_content, ["product_card", "product_link"]
     )
-
-    llm_strategy = LLMExtractionStrategy(
-        llm_config=llm_config,
-        schema=selector_schema,
-        extraction_type="schema",
-        instruction=prompt,
-        input_format="html"
-    )
-
-    browser_cfg = BrowserConfig(headless=True)
-    run_cfg = CrawlerRunConfig(
-        extraction_strategy=llm_strategy,
-        cache_mode=CacheMode.BYPASS
-    )
-
-    async with AsyncWebCrawler(config=browser_cfg) as crawler:
-        result = await crawler.arun(url, config=run_cfg)
-
-    if not result or not result.extracted_content:
-        print("No listing selectors extracted")
-        return
-
-    selectors = json.loads(result.extracted_content)
-
-    if isinstance(selectors, list):
-        selectors = selectors[0]
-
-    for key in selector_schema:
-        if key not in selectors or not isinstance(selectors[key], str):
-            selectors[key] = ""
+    if selectors is None:
+        selectors = await llm_selectors(llm_cfg, selector_schema, prompt, url, html_content)
+        if selectors is None:
+            print("No listing selectors extracted")
+            return
+        templates.remember("listing", html_content, selectors, url)
 
     with open(listing_selector_path, "w", encoding="utf-8") as f:
         json.dump(selectors, f, indent=2, ensure_ascii=False)
@@ -490,75 +482,154 @@ FINAL OUTPUT FORMAT (STRICT)
 
     await product_page(llm_cfg, product_html, product_url, base_dir)
 
-    listing_scraper(html_content,selectors,base_dir,product_selector_path)
+    # scrapers run their own event loop (shared browser), keep them off this one
+    return await asyncio.to_thread(listing_scraper, html_content, selectors, base_dir, product_selector_path, url,
+                                   append=append)
+
+def selectors_fit(selectors, html_content):
+    # required fields come back non-empty on this page
+    if not selectors or not html_content:
+        return False
+    row = compile_selectors(selectors).extract(html_content)
+    required = [field for field in REQUIRED_FIELDS if selectors.get(field)] or [f for f in selectors if selectors[f]]
+    return bool(required) and all(row.get(field) for field in required)
+
+
+def ask_cluster_kind(group):
+    total = sum(cluster["count"] for cluster in group)
+    print(f"\nURL cluster ({total} URLs):")
+    for cluster in group[:5]:
+        mixed = "  [mixed templates]" if cluster.get("mixed") else ""
+        print(f"  {cluster['pattern']}  ({cluster['count']} URLs){mixed}")
+    if len(group) > 5:
+        print(f"  ... {len(group) - 5} more patterns with the same page template")
+    for url in group[0]["examples"][:3]:
+        print(f"    e.g. {url}")
+
+    choices = {"p": PRODUCT, "l": LISTING, "s": SKIP}
+    while True:
+        choice = input("Treat this cluster as (p)roduct, (l)isting or (s)kip: ").strip().lower()
+        if choice[:1] in choices:
+            return choices[choice[:1]]
+        print("Invalid choice")
 
-async def sitemap(sitemap_url, llm_cfg, base_dir):
-    import requests
-    import random
-    import xml.etree.ElementTree as ET
-
-    resp = requests.get(sitemap_url, timeout=20)
-    resp.raise_for_status()
-    root = ET.fromstring(resp.text)
-
-    ns = {"ns": "http://www.sitemaps.org/schemas/sitemap/0.9"}
-    urls = []
-
-    if root.tag.endswith("sitemapindex"):
-        for sm in root.findall("ns:sitemap", ns):
-            loc = sm.find("ns:loc", ns)
-            if loc is not None and loc.text:
-                child = requests.get(loc.text.strip(), timeout=20)
-                child_root = ET.fromstring(child.text)
-                for url in child_root.findall("ns:url", ns):
-                    loc2 = url.find("ns:loc", ns)
-                    if loc2 is not None and loc2.text:
-                        urls.append(loc2.text.strip())
-
-    elif root.tag.endswith("urlset"):
-        for url in root.findall("ns:url", ns):
-            loc = url.find("ns:loc", ns)
-            if loc is not None and loc.text:
-                urls.append(loc.text.strip())
-
-    if not urls:
-        print("No URLs found in sitemap")
-        return
 
-    tried = set()
+def load_selectors(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-    while True:
-        remaining = list(set(urls) - tried)
-        if not remaining:
-            print("No more URLs left to try")
-            return
 
-        candidate = random.choice(remaining)
-        tried.add(candidate)
+async def cluster_product_selectors(llm_cfg, group, base_dir, product_selector_path):
+    """
+    product selectors for one cluster group: the group's own file or the domain selectors when they fit
+    its pages, the llm otherwise. new selectors go to the group's file (selectors/<domain>/clusters/),
+    the domain product_selector.json is only written when there is none yet.
+    """
+    sampled = next((cluster for cluster in group if cluster.get("sample_html")), None)
+    url = sampled["sample_url"] if sampled else group[0]["examples"][0]
+    domain = urlparse(url).hostname or "unknown"
+    cluster_path = cluster_selector_path(base_dir, domain, group[0]["pattern"])
+    candidates = [load_selectors(cluster_path), load_selectors(product_selector_path)]
+
+    if sampled:
+        for existing in candidates:
+            if selectors_fit(existing, sampled["sample_html"]):
+                return existing
+
+    html = await html_collection(url, base_dir)
+    if not html:
+        print(f"Failed to fetch HTML for {url}")
+        return None
+    for existing in candidates:
+        if selectors_fit(existing, html):
+            return existing
+
+    selectors = await product_page(llm_cfg, html, url, base_dir, selector_path=cluster_path)
+    if selectors is not None and not os.path.exists(product_selector_path):
+        # sitemap_scraper falls back to the domain selectors for unlabelled urls
+        ensure_dir(os.path.dirname(product_selector_path))
+        with open(product_selector_path, "w", encoding="utf-8") as f:
+            json.dump(selectors, f, indent=2, ensure_ascii=False)
+    return selectors
 
-        print(f"\nSelected URL:\n{candidate}")
-        choice = input(
-            "Treat this as (p)roduct, (l)isting, or (r)e-do: "
-        ).strip().lower()
 
-        if choice == "r":
-            continue
-        if choice not in ("p", "l"):
-            print("Invalid choice")
+async def sitemap(sitemap_url, llm_cfg, base_dir):
+    # sitemap urls are clustered by path pattern, clusters with the same page template are grouped
+    # (cheap http sample, no browser) and every group is labelled once instead of one random url
+    async with HttpClient() as client:
+        urls = unique_urls(await gather_sitemap_urls(sitemap_url, client))
+        if not urls:
+            print("No URLs found in sitemap")
+            return
+        clusters = cluster_urls(urls)
+        print(f"\n{len(urls)} sitemap URLs in {len(clusters)} path clusters, sampling pages...")
+        groups = await sample_clusters(clusters, client)
+
+    domain = urlparse(sitemap_url).hostname or "unknown"
+    cluster_map = ClusterMap(base_dir, domain)
+    templates = TemplateStore(base_dir, domain)
+    product_selector_path = os.path.join(base_dir, "selectors", domain, "product_selector.json")
+    listing_groups = []
+
+    for group in groups:
+        # labelled by an earlier run
+        known = [cluster_map.clusters.get(cluster["pattern"]) for cluster in group]
+        if all(known):
+            kind = known[0]["kind"]
+            for cluster, label in zip(group, known):
+                cluster_map.label(cluster, label["kind"], label.get("selectors"))
+            print(f"{group[0]['pattern']}: {kind} (labelled earlier)")
+            if kind == LISTING:
+                listing_groups.append(group)
             continue
 
-        html = await html_collection(candidate, base_dir)
+        # page template the llm already saw -> no question
+        kind = None
+        sampled = next((cluster for cluster in group if cluster.get("sample_html")), None)
+        if sampled:
+            for template_kind in (PRODUCT, LISTING):
+                if templates.find(template_kind, sampled["sample_html"]):
+                    kind = template_kind
+                    print(f"{group[0]['pattern']}: {kind} (known page template)")
+                    break
+        if kind is None:
+            kind = ask_cluster_kind(group)
+
+        selectors = None
+        if kind == PRODUCT:
+            selectors = await cluster_product_selectors(llm_cfg, group, base_dir, product_selector_path)
+            if selectors is None:
+                print("No product selectors for this cluster, skipping it")
+                kind = SKIP
+
+        for cluster in group:
+            cluster_map.label(cluster, kind, selectors)
+        # saved per group, an interrupted session keeps the labels made so far
+        cluster_map.save()
+        if kind == LISTING:
+            listing_groups.append(group)
+
+    print(f"✓ Sitemap clusters labelled: {dict(cluster_map.kinds())}")
+
+    # the sitemap scraper only renders product clusters, listing clusters get the listing flow
+    # (listing selectors + listing scraping from one of their pages). all of them write the same
+    # products.csv, only the first scrape of the session starts it over
+    written = False
+    for group in listing_groups:
+        sampled = next((cluster for cluster in group if cluster.get("sample_url")), None)
+        url = sampled["sample_url"] if sampled else group[0]["examples"][0]
+        print(f"\nListing cluster {group[0]['pattern']}: scraping from {url}")
+        html = await html_collection(url, base_dir)
         if not html:
-            print("Failed to fetch HTML, re-doing")
+            print(f"Failed to fetch HTML for {url}, listing cluster skipped")
             continue
-
-        if choice == "p":
-            await product_page(llm_cfg, html, candidate, base_dir)
-        else:
-            await listing_page(llm_cfg, html, candidate, base_dir)
-
-        print("✓ Sitemap selector generation complete")
-        return
+        if await listing_page(llm_cfg, html, url, base_dir, append=written):
+            written = True
+    print("✓ Sitemap selector generation complete")
+    # True when listing clusters already wrote rows, the sitemap scrape appends to them
+    return written
 
 
 # all inputs, no need to make any major changes here if changes made in overall code
@@ -612,7 +683,7 @@ async def get_user_input():
             await listing_page(llm_cfg,html_content, url, base_dir)
         elif crawl_mode == 'sitemap':
 
-            await sitemap(sitemap_url, llm_cfg, base_dir)
+            written = await sitemap(sitemap_url, llm_cfg, base_dir)
             domain = urlparse(sitemap_url).hostname or "unknown"
             product_selector_path = os.path.join(
                 base_dir, "selectors", domain, "product_selector.json"
@@ -622,7 +693,7 @@ async def get_user_input():
                 print("❌ Product selector not found. Run LLM product page once first.")
                 return
 
-            sitemap_scraper(sitemap_url, product_selector_path, base_dir)
+            await asyncio.to_thread(sitemap_scraper, sitemap_url, product_selector_path, base_dir, append=written)
     elif use_llm in ['n', 'no']:
         llm_enabled = False
         print("✓ LLM extraction disabled")
@@ -636,7 +707,7 @@ async def get_user_input():
                 print("❌ Product selector not found. Run LLM product page once first.")
                 return
 
-            sitemap_scraper(sitemap_url, product_selector_path, base_dir)
+            await asyncio.to_thread(sitemap_scraper, sitemap_url, product_selector_path, base_dir)
 
         else:
             # Manual selector logic stays here
@@ -652,7 +723,7 @@ async def get_user_input():
                     listing_selectors = json.load(f)
                 with open(product_selector_path, "r", encoding="utf-8") as f:
                     product_selectors = json.load(f)
-                listing_scraper(html_content, listing_selectors, base_dir, product_selector_path)
+                await asyncio.to_thread(listing_scraper, html_content, listing_selectors, base_dir, product_selector_path, url)
     else:
         print("Please enter 'y' for yes or 'n' for no")
 
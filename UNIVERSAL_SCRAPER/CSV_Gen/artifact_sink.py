@@ -0,0 +1,155 @@
+# background writer for crawl artifacts (html, markdown, pdf, screenshot, metadata, json of a page)
+# the crawl hands over a result and goes on, writer threads fan it out to the files (save_data.save_crawl_result)
+# or append it to warc segments (warc_store.py), CRAWL_STORAGE picks one
+"""
+async with ArtifactSink(base_dir) as sink:
+    async for result in ...:
+        await sink.put(result)        # waits while the queue is full -> the crawl slows down to disk speed
+# leaving the block waits until every queued result is on disk
+
+on_saved(key, ok) -> called from a writer thread once a result is written (ok=True, duplicates included)
+                     or failed to save, key is the one given to put() (default result.url)
+
+queue   -> results waiting for a writer, a result (with its base64 screenshot + pdf) is released once written
+workers -> writer threads, file writes release the GIL so a few threads keep a disk busy
+dedupe  -> link | drop | off, a page whose html was already saved in this run (content_dedupe) is not
+           written again: link records which page it duplicates (duplicates.jsonl / warc revisit record).
+           near matches (DEDUPE_MAX_DISTANCE > 0) are recorded in link mode and still saved
+"""
+import queue
+import asyncio
+import logging
+import threading
+
+from CSV_Gen.save_data import save_crawl_result, duplicate_link
+from CSV_Gen.warc_store import WarcStore
+from CSV_Gen.content_dedupe import DuplicateIndex, content_fingerprint
+from CSV_Gen.settings import ARTIFACT_QUEUE, ARTIFACT_WRITERS, CRAWL_STORAGE, DEDUPE_MODE
+logger = logging.getLogger("selector_discovery")
+
+_STOP = object()
+
+
+class ArtifactSink:
+
+    def __init__(self, base_dir, queue_size=ARTIFACT_QUEUE, workers=ARTIFACT_WRITERS, pdf=True, screenshot=True,
+                 storage=CRAWL_STORAGE, dedupe=DEDUPE_MODE, html=True, on_saved=None):
+        if storage not in ("files", "warc"):
+            raise ValueError(f"Unknown crawl storage {storage}")
+        self.base_dir = base_dir
+        self.pdf = pdf
+        self.screenshot = screenshot
+        self.html = html
+        self.on_saved = on_saved
+        self.storage = storage
+        self._store = WarcStore(base_dir) if storage == "warc" else None
+        self.dedupe = dedupe
+        self.duplicates = DuplicateIndex() if dedupe != "off" else None
+        self.written = 0
+        self.failed = 0
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._count_lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"artifact-writer-{number}", daemon=True)
+            for number in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.to_thread(self.close)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                result, key = item
+                try:
+                    saved = not self._duplicate(result)
+                    if saved:
+                        self._save(result)
+                    ok = True
+                except Exception as e:
+                    logger.error(f"Saving artifacts failed for {getattr(result, 'url', '?')}: {e}")
+                    ok = saved = False
+                with self._count_lock:
+                    if not ok:
+                        self.failed += 1
+                    elif saved:
+                        self.written += 1
+                if self.on_saved is not None:
+                    try:
+                        self.on_saved(key or result.url, ok)
+                    except Exception as e:
+                        logger.error(f"on_saved failed for {key or result.url}: {e}")
+            finally:
+                item = result = None
+                self._queue.task_done()
+
+    def _duplicate(self, result):
+        # True when the page is an exact copy and is not saved
+        if self.duplicates is None:
+            return False
+        fingerprint = content_fingerprint(result.cleaned_html or result.html)
+        found = self.duplicates.check(result.url, fingerprint)
+        if found is None:
+            return False
+        original, match, distance = found
+        logger.info(f"Duplicate ({match}) of {original}: {result.url}")
+        if self.dedupe == "link":
+            if self._store is not None:
+                self._store.write_revisit(result.url, original, match, distance)
+            else:
+                duplicate_link(result.url, self.base_dir, original, match, distance)
+        return match == "exact"
+
+    def _save(self, result):
+        if self._store is not None:
+            self._store.save_result(result, pdf=self.pdf, screenshot=self.screenshot, html=self.html)
+        else:
+            save_crawl_result(result, self.base_dir, pdf=self.pdf, screenshot=self.screenshot, html=self.html)
+
+    def submit(self, result, key=None):
+        """blocking put for sync callers"""
+        if self._threads is None:
+            raise RuntimeError("ArtifactSink is closed")
+        self._queue.put((result, key))
+
+    async def put(self, result, key=None):
+        if self._threads is None:
+            raise RuntimeError("ArtifactSink is closed")
+        item = (result, key)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # disk is behind, the caller waits here (off the event loop) until a writer frees a slot
+            await asyncio.to_thread(self._queue.put, item)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """waits for every queued result to be written, then stops the writers"""
+        if self._threads is None:
+            return
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = None
+        if self._store is not None:
+            self._store.close()
+        if self.failed:
+            logger.error(f"{self.failed} crawl results could not be saved")
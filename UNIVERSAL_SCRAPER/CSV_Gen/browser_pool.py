@@ -0,0 +1,100 @@
+# one headless browser for a whole csv scraper run instead of one chromium per url
+import asyncio
+import logging
+from contextlib import nullcontext
+from crawl4ai import AsyncWebCrawler
+from crawl4ai.async_configs import BrowserConfig
+
+from CSV_Gen.rate_limit import Ticket
+from CSV_Gen.settings import BROWSER_POOL_SIZE, BROWSER_RECYCLE_AFTER
+logger = logging.getLogger("selector_discovery")
+
+
+class BrowserPool:
+    """
+    Shared AsyncWebCrawler for listing_scraper / sitemap_scraper.
+
+    pool_size  -> how many pages can render at the same time on the browser
+    recycle_after -> browser is closed and relaunched after this many pages
+                     (waits for in-flight pages first), keeps chromium memory bounded
+    limiter -> shared RateLimiter, every render takes a slot of its host and reports the status
+
+    usage:
+        async with BrowserPool() as pool:
+            result = await pool.arun(url, config=run_cfg)
+    """
+
+    def __init__(self, pool_size=BROWSER_POOL_SIZE, recycle_after=BROWSER_RECYCLE_AFTER, browser_cfg=None, limiter=None):
+        self.pool_size = max(1, int(pool_size))
+        self.limiter = limiter
+        self.recycle_after = int(recycle_after or 0)
+        self.browser_cfg = browser_cfg or BrowserConfig(headless=True)
+
+        self._crawler = None
+        self._pages = asyncio.Semaphore(self.pool_size)
+        self._state = asyncio.Condition()
+        self._in_flight = 0
+        self._served = 0
+        self._recycling = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def arun(self, url, config):
+        async with self._pages:
+            crawler = await self._checkout()
+            try:
+                async with (self.limiter.slot(url) if self.limiter else nullcontext(Ticket())) as ticket:
+                    result = await crawler.arun(url, config=config)
+                    if result is not None:
+                        ticket.status = result.status_code or (200 if result.success else None)
+                return result
+            finally:
+                await self._checkin()
+
+    async def close(self):
+        async with self._state:
+            await self._state.wait_for(lambda: self._in_flight == 0)
+            await self._shutdown()
+
+    async def _checkout(self):
+        async with self._state:
+            await self._state.wait_for(lambda: not self._recycling)
+            if self._crawler is None:
+                self._crawler = AsyncWebCrawler(config=self.browser_cfg)
+                await self._crawler.start()
+                logger.info(f"Browser started (pool_size={self.pool_size})")
+            self._in_flight += 1
+            return self._crawler
+
+    async def _checkin(self):
+        async with self._state:
+            self._in_flight -= 1
+            self._served += 1
+            self._state.notify_all()
+
+            if not self.recycle_after or self._served < self.recycle_after or self._recycling:
+                return
+
+            # drain the pages still rendering, then relaunch on next checkout
+            self._recycling = True
+            try:
+                await self._state.wait_for(lambda: self._in_flight == 0)
+                logger.info(f"Recycling browser after {self._served} pages")
+                await self._shutdown()
+            finally:
+                self._recycling = False
+                self._state.notify_all()
+
+    async def _shutdown(self):
+        if self._crawler is None:
+            return
+        try:
+            await self._crawler.close()
+        except Exception as e:
+            logger.error(f"Browser close error: {e}")
+        self._crawler = None
+        self._served = 0
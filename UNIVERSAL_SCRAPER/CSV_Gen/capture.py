@@ -0,0 +1,186 @@
+# capture profiles for crawls: what is rendered and saved per page
+# screenshots and pdfs dominate render time and disk, most runs only need text or html
+"""
+profiles (CAPTURE_PROFILE, or picked per run in crawl_main):
+    default                    every crawl mode keeps its own render options (MODE_OPTIONS), everything
+                               the render produced is saved
+    text     (text-only)       markdown + metadata + json, no html files, no screenshot / pdf
+    html     (html+markdown)   clean html + markdown + metadata + json
+    visual   (full-visual)     all of html plus full page screenshot and pdf (waits for images, scrolls the page)
+a picked profile only changes the capture options of the mode: text / html drop screenshot, pdf and the
+wait for images, the mode's full page scan (lazy loaded links) stays. the site crawl (frontier mode)
+renders without visuals by default.
+
+visual pages can be limited, for a picked profile and for the visual modes of the default one alike:
+    CAPTURE_VISUAL_PATTERN  -> regex, only matching urls get screenshot / pdf
+    CAPTURE_VISUAL_SAMPLE   -> fraction of urls (0.05 = every 20th url), picked by url hash so the same
+                               urls are picked in every run and every worker process
+when limited, deep crawls render without visuals and only the picked pages get a second, visual render,
+the frontier renders page by page and gives picked pages the visual render right away
+
+screenshots are re-encoded before they are written (CAPTURE_IMAGE_FORMAT png | webp | jpeg,
+CAPTURE_IMAGE_QUALITY), Pillow is optional, without it the png is kept
+"""
+import io
+import re
+import base64
+import logging
+
+from CSV_Gen.url_canon import url_fingerprint
+from CSV_Gen.settings import (
+    CAPTURE_PROFILE, CAPTURE_VISUAL_PATTERN, CAPTURE_VISUAL_SAMPLE, CAPTURE_IMAGE_FORMAT, CAPTURE_IMAGE_QUALITY
+)
+logger = logging.getLogger("selector_discovery")
+
+try:
+    from PIL import Image
+except ImportError:  # optional
+    Image = None
+
+PROFILES = {
+    "text": {"html": False, "screenshot": False, "pdf": False},
+    "html": {"html": True, "screenshot": False, "pdf": False},
+    "visual": {"html": True, "screenshot": True, "pdf": True}
+}
+PROFILE_NAMES = {"text-only": "text", "html+markdown": "html", "full-visual": "visual"}
+DEFAULT_PROFILE = "default"
+
+# capture options each crawl mode renders with when no profile is picked
+MODE_OPTIONS = {
+    "breadth": {"screenshot": True, "pdf": True},
+    "depth": {},
+    "best": {"pdf": True, "screenshot": True, "scan_full_page": True, "wait_for_images": True},
+    "frontier": {}
+}
+
+IMAGE_FORMATS = {
+    "png": ("PNG", ".png", "image/png"),
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "jpg": ("JPEG", ".jpg", "image/jpeg")
+}
+WEBP_MAX_SIDE = 16383
+SAMPLE_BUCKETS = 10000
+
+
+class CapturePlan:
+    """
+    plan = CapturePlan("html")
+    CrawlerRunConfig(..., **plan.crawl_options("best"))   -> options of the main crawl (MODE_OPTIONS key)
+    plan.wants_visual(url, "best")                    -> page gets screenshot / pdf in that mode
+    plan.lazy("best")                                 -> visual pages need their own render
+    plan.visual_options("best")                       -> options of that render
+    """
+
+    def __init__(self, profile=CAPTURE_PROFILE, visual_pattern=CAPTURE_VISUAL_PATTERN,
+                 visual_sample=CAPTURE_VISUAL_SAMPLE):
+        name = PROFILE_NAMES.get(profile, profile) or DEFAULT_PROFILE
+        if name != DEFAULT_PROFILE and name not in PROFILES:
+            raise ValueError(f"Unknown capture profile {profile}, use one of {DEFAULT_PROFILE}, {', '.join(PROFILES)}")
+        self.name = name
+        # no profile picked: the render options stay the mode's, whatever it renders is saved
+        self.picked = name != DEFAULT_PROFILE
+        capture = PROFILES[name] if self.picked else PROFILES["visual"]
+        self.html = capture["html"]
+        self.screenshot = capture["screenshot"]
+        self.pdf = capture["pdf"]
+        self.pattern = re.compile(visual_pattern) if visual_pattern else None
+        self.sample = min(max(float(visual_sample), 0.0), 1.0)
+
+    @property
+    def visual(self):
+        return self.screenshot or self.pdf
+
+    @property
+    def limited(self):
+        return self.pattern is not None or self.sample < 1.0
+
+    def mode_visual(self, mode=None):
+        """a mode renders screenshot / pdf: the picked profile decides, else the mode's own options"""
+        if self.picked:
+            return self.visual
+        base = MODE_OPTIONS.get(mode, {})
+        return bool(base.get("screenshot") or base.get("pdf"))
+
+    def lazy(self, mode=None):
+        return self.limited and self.mode_visual(mode)
+
+    def wants_visual(self, url, mode=None):
+        if not self.mode_visual(mode):
+            return False
+        if self.pattern is not None and not self.pattern.search(url):
+            return False
+        if self.sample < 1.0:
+            return url_fingerprint(url) % SAMPLE_BUCKETS < self.sample * SAMPLE_BUCKETS
+        return True
+
+    def run_options(self, visual, base=None):
+        """CrawlerRunConfig kwargs of a render with / without visuals on top of base (a mode's options)"""
+        options = dict(base or {})
+        if visual:
+            options.update(screenshot=self.screenshot, pdf=self.pdf, wait_for_images=True, scan_full_page=True)
+        else:
+            # scan_full_page of the mode is kept, it loads lazy content and links, not only images
+            options.update(screenshot=False, pdf=False, wait_for_images=False)
+        return options
+
+    def crawl_options(self, mode=None):
+        """options of a crawl in one of MODE_OPTIONS, the mode's own unless a profile is picked or visuals limited"""
+        base = MODE_OPTIONS.get(mode, {})
+        # limited visuals: the crawl renders without them, picked pages are rendered again
+        if self.lazy(mode):
+            return self.run_options(False, base)
+        if not self.picked:
+            return dict(base)
+        return self.run_options(self.visual, base)
+
+    def visual_options(self, mode=None):
+        """options of the visual render of a picked page (wants_visual) in a limited mode"""
+        base = MODE_OPTIONS.get(mode, {})
+        if not self.picked:
+            return dict(base)
+        return self.run_options(True, base)
+
+    def describe(self):
+        limits = []
+        if self.pattern is not None:
+            limits.append(f"urls matching {self.pattern.pattern}")
+        if self.sample < 1.0:
+            limits.append(f"{self.sample:.0%} of urls")
+        visuals = f"visuals for {', '.join(limits)}" if self.visual and limits else ""
+        if not self.picked:
+            return f"{self.name} (each crawl mode's own options{', ' + visuals if visuals else ''})"
+        return self.name + (f" ({visuals})" if visuals else "")
+
+
+def encode_screenshot(screenshot, image_format=CAPTURE_IMAGE_FORMAT, quality=CAPTURE_IMAGE_QUALITY):
+    """
+    base64 png from crawl4ai -> (bytes, extension, content type) in the configured format, None when
+    the screenshot can't be decoded. Falls back to the png when Pillow is missing or re-encoding fails.
+    """
+    try:
+        png = base64.b64decode(screenshot)
+    except Exception as e:
+        logger.error(f"Failed to decode screenshot: {e}")
+        return None
+
+    pil_format, ext, content_type = IMAGE_FORMATS.get((image_format or "png").lower(), IMAGE_FORMATS["png"])
+    if pil_format == "PNG":
+        return png, ext, content_type
+    if Image is None:
+        logger.error("Pillow not installed, keeping png screenshots")
+        return png, ".png", "image/png"
+
+    try:
+        with Image.open(io.BytesIO(png)) as image:
+            if pil_format == "WEBP" and max(image.size) > WEBP_MAX_SIDE:
+                # full page screenshots of long pages are over webp's size limit
+                pil_format, ext, content_type = IMAGE_FORMATS["jpeg"]
+            if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            out = io.BytesIO()
+            image.save(out, pil_format, quality=quality, optimize=True)
+    except Exception as e:
+        logger.error(f"Screenshot re-encoding failed, keeping png: {e}")
+        return png, ".png", "image/png"
+    return out.getvalue(), ext, content_type
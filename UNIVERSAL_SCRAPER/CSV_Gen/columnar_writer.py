@@ -0,0 +1,130 @@
+# parquet output written next to products.csv, as a products.parquet/ dataset folder
+# analytics jobs read only the columns they need (price, availability...) instead of reparsing csv text
+import os
+import csv
+import logging
+from datetime import datetime
+from pathlib import Path
+
+from CSV_Gen.settings import PARQUET_ROW_GROUP
+logger = logging.getLogger("selector_discovery")
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional
+    pa = None
+
+
+def parquet_available():
+    return pa is not None
+
+
+class ParquetRowWriter:
+    """
+    same interface as CsvRowWriter (write / flush / close / count).
+
+    every column is a nullable string (selector fields + url). rows are buffered until row_group of them
+    are there (or close / flush(sync=True)) and then written as a finished part file: written to a .tmp
+    file, footer included, then renamed into place, so a crash never leaves a parquet file without its footer.
+    rows still buffered when a run dies are only in the csv, backfill(csv_path) copies them over on resume.
+        products.parquet/part-<timestamp>-<n>.parquet
+    path is the dataset folder, read it as one table: pq.read_table("products.parquet") / pyarrow.dataset /
+    duckdb 'products.parquet/*.parquet'. only parts live there, no csv next to them.
+    a fresh run (append=False) removes the parts of earlier runs, like the csv is rewritten.
+    """
+
+    def __init__(self, path, fieldnames, row_group=PARQUET_ROW_GROUP, append=False, compression="zstd"):
+        if pa is None:
+            raise ImportError("pyarrow is required for parquet output")
+        self.path = Path(path)
+        self.fieldnames = list(fieldnames)
+        self.schema = pa.schema([(name, pa.string()) for name in self.fieldnames])
+        self.row_group = max(1, row_group)
+        self.batch_size = self.row_group
+        self.append = append
+        self.compression = compression
+        self.count = 0
+        self.parts = []
+
+        self._started = datetime.now().strftime("%Y%m%d%H%M%S")
+        self._cleared = append
+        self._columns = {name: [] for name in self.fieldnames}
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, row):
+        for name in self.fieldnames:
+            value = row.get(name)
+            self._columns[name].append(None if value is None else str(value))
+        self._buffered += 1
+        self.count += 1
+        if self._buffered >= self.row_group:
+            self.flush()
+
+    def _part_path(self):
+        number = len(self.parts)
+        while True:
+            part = self.path / f"part-{self._started}-{number:05d}.parquet"
+            if not part.exists():
+                return part
+            number += 1
+
+    def _old_parts(self):
+        return list(self.path.glob("part-*.parquet")) if self.path.is_dir() else []
+
+    def _clear_old_parts(self):
+        # only on the first flush of a fresh run, so a run without rows leaves earlier output alone
+        self._cleared = True
+        for old in self._old_parts() + list(self.path.glob("*.tmp") if self.path.is_dir() else []):
+            old.unlink()
+
+    def _rows_on_disk(self):
+        return sum(pq.read_metadata(part).num_rows for part in self._old_parts())
+
+    def backfill(self, csv_path):
+        # parquet holds a prefix of the csv (same rows, same order, written less often): rows past it are
+        # the ones a dead run had buffered, or the rows of a scrape that ran without parquet
+        csv_path = Path(csv_path)
+        if not self.append or not csv_path.exists():
+            return 0
+        skip = self._rows_on_disk()
+        added = 0
+        with csv_path.open(newline="", encoding="utf-8") as f:
+            for index, row in enumerate(csv.DictReader(f)):
+                if index >= skip:
+                    self.write(row)
+                    added += 1
+        if added:
+            logger.info(f"{added} rows copied from {csv_path.name} to parquet")
+        return added
+
+    def flush(self, sync=False):
+        # the fanout flushes every csv batch, a part is only written once it is full
+        if not self._buffered or (self._buffered < self.row_group and not sync):
+            return
+        if self.path.is_file():
+            # single-file output of older runs, the folder takes its name
+            self.path.unlink()
+        self.path.mkdir(parents=True, exist_ok=True)
+        if not self._cleared:
+            self._clear_old_parts()
+        part = self._part_path()
+        tmp = part.with_name(part.name + ".tmp")
+        table = pa.Table.from_pydict(self._columns, schema=self.schema)
+        with open(tmp, "wb") as f:
+            pq.write_table(table, f, row_group_size=self.row_group, compression=self.compression)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, part)
+        self.parts.append(part)
+        self._columns = {name: [] for name in self.fieldnames}
+        self._buffered = 0
+
+    def close(self):
+        self.flush(sync=True)
@@ -0,0 +1,158 @@
+# duplicate page detection on content
+# the same product is often reachable under several urls (colour / size params, print views, tracking
+# variants that survive canonicalization). a page whose html was already seen in this run is linked
+# to the first one instead of being stored or extracted again.
+# near matches (simhash) are opt-in and only reported: pages of one template that differ in name and
+# price are within a few bits of each other, so callers still process a near match.
+"""
+content_fingerprint(html) -> (exact, simhash)
+    exact   -> blake2b of the normalized html (scripts, styles, comments, hidden inputs, nonces removed,
+               whitespace collapsed), same value = same page
+    simhash -> 64-bit SimHash over word 3-shingles of the visible text, boilerplate containers
+               (nav, header, footer, aside) left out. None for pages with too little text to judge
+
+index = DuplicateIndex()
+index.check(url, fingerprint) -> None (new page, now indexed) or (first_url, "exact" | "near", distance)
+    "exact" -> same page, callers skip it
+    "near"  -> only with max_distance > 0 (DEDUPE_MAX_DISTANCE), similar page, callers still process it
+
+near lookups use LSH banding: the 64 bits are cut into max_distance + 1 bands, two hashes within
+max_distance bits agree on at least one band, so only pages sharing a band are compared.
+"""
+import re
+import hashlib
+import logging
+import threading
+from array import array
+from collections import Counter
+
+from lxml import etree, html as lxml_html
+
+from CSV_Gen.settings import DEDUPE_MAX_DISTANCE, DEDUPE_MIN_TOKENS
+logger = logging.getLogger("selector_discovery")
+
+NOISE_TAGS = ["script", "style", "noscript", "template", "svg", "canvas", "iframe"]
+BOILERPLATE_TAGS = ["nav", "header", "footer", "aside"]
+VOLATILE_ATTRS = ("nonce", "integrity", "data-csrf", "data-token", "data-timestamp")
+SHINGLE = 3
+BITS = 64
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SPACE = re.compile(r"\s+")
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(tokens, shingle=SHINGLE):
+    """64-bit SimHash of a token list (word shingles weighted by how often they occur)"""
+    if len(tokens) >= shingle:
+        grams = (" ".join(tokens[i:i + shingle]) for i in range(len(tokens) - shingle + 1))
+    else:
+        grams = iter(tokens)
+    weights = Counter(_hash64(gram) for gram in grams)
+
+    votes = [0] * BITS
+    for value, weight in weights.items():
+        for bit in range(BITS):
+            if value >> bit & 1:
+                votes[bit] += weight
+            else:
+                votes[bit] -= weight
+    result = 0
+    for bit, vote in enumerate(votes):
+        if vote > 0:
+            result |= 1 << bit
+    return result
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def content_fingerprint(html, min_tokens=DEDUPE_MIN_TOKENS):
+    """(exact hex digest, simhash or None), (None, None) for empty / unparsable html"""
+    if not html or not html.strip():
+        return None, None
+    try:
+        doc = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return None, None
+
+    etree.strip_elements(doc, *NOISE_TAGS, with_tail=False)
+    etree.strip_elements(doc, etree.Comment, with_tail=False)
+    for hidden in doc.xpath("//input[@type='hidden']"):
+        hidden.drop_tree()
+    for element in doc.iter():
+        if not isinstance(element.tag, str):
+            continue
+        for name in [name for name in element.attrib if name.startswith(VOLATILE_ATTRS)]:
+            del element.attrib[name]
+    normalized = _SPACE.sub(" ", lxml_html.tostring(doc, encoding="unicode"))
+    exact = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+    etree.strip_elements(doc, *BOILERPLATE_TAGS, with_tail=False)
+    tokens = _WORD.findall(doc.text_content().lower())
+    near = simhash(tokens) if len(tokens) >= min_tokens else None
+    return exact, near
+
+
+class DuplicateIndex:
+    """first url per exact digest + simhashes in band buckets, thread safe"""
+
+    def __init__(self, max_distance=DEDUPE_MAX_DISTANCE):
+        self.max_distance = max(0, min(int(max_distance), BITS // 2 - 1))
+        bands = self.max_distance + 1
+        width = BITS // bands
+        # (shift, mask) per band, the last band takes the leftover bits
+        self._bands = [(i * width, (1 << (width if i < bands - 1 else BITS - i * width)) - 1) for i in range(bands)]
+        self._buckets = [{} for _ in self._bands]
+        self._exact = {}
+        self._urls = []
+        self._hashes = array("Q")
+        self._lock = threading.Lock()
+        self.duplicates = Counter()
+
+    def __len__(self):
+        return len(self._exact)
+
+    def _near(self, value):
+        best = None
+        for (shift, mask), bucket in zip(self._bands, self._buckets):
+            for page in bucket.get(value >> shift & mask, ()):
+                distance = hamming(value, self._hashes[page])
+                if distance <= self.max_distance and (best is None or distance < best[1]):
+                    best = (page, distance)
+                    if distance == 0:
+                        return best
+        return best
+
+    def check(self, url, fingerprint):
+        exact, near = fingerprint
+        if exact is None:
+            return None
+        with self._lock:
+            page = self._exact.get(exact)
+            if page is not None:
+                self.duplicates["exact"] += 1
+                return self._urls[page], "exact", 0
+
+            page = len(self._urls)
+            self._urls.append(url)
+            self._exact[exact] = page
+
+            if near is not None and self.max_distance:
+                found = self._near(near)
+                if found is not None:
+                    # exact copies of this page still match it, its simhash isn't indexed again
+                    self._hashes.append(0)
+                    self.duplicates["near"] += 1
+                    return self._urls[found[0]], "near", found[1]
+
+            # pages without a simhash are only matched exactly
+            self._hashes.append(near or 0)
+            if near is not None and self.max_distance:
+                for (shift, mask), bucket in zip(self._bands, self._buckets):
+                    bucket.setdefault(near >> shift & mask, []).append(page)
+            return None
@@ -0,0 +1,111 @@
+# shrinks page html before it goes to the llm
+# the selector prompts only need the structure (tags, classes, ids, data-*) and a hint of the text,
+# so scripts, styles, svg, long text and 40 identical product cards are all wasted tokens
+"""
+minimize_html(html)
+    - drops non-content subtrees (script, style, svg, iframe, template, comments...)
+    - keeps only attributes a selector can use (class, id, data-*, itemprop, href...). class and id are
+      kept whole, other long values lose whole words from the end (a selector never sees half a token),
+      long data-* values (json blobs like shopify's data-product) are cut at MAX_ATTR_CHARS, the name stays
+    - collapses runs of repeated siblings (same tag + class) to MINIMIZE_KEEP_REPEATS exemplars,
+      a comment tells the model how many were removed (listing prompt still sees "multiple" cards)
+    - truncates text nodes to MINIMIZE_TEXT_CHARS
+"""
+import logging
+from lxml import etree
+from lxml import html as lxml_html
+
+from CSV_Gen.settings import MINIMIZE_KEEP_REPEATS, MINIMIZE_TEXT_CHARS
+logger = logging.getLogger("selector_discovery")
+
+DROP_TAGS = ["script", "style", "noscript", "template", "svg", "iframe", "canvas", "video", "audio",
+             "object", "embed", "link", "meta", "base"]
+KEEP_ATTRS = {"class", "id", "href", "itemprop", "itemtype", "itemscope", "role", "aria-label", "name", "type",
+              "rel", "title", "alt", "for", "value", "selected", "checked", "disabled"}
+MAX_ATTR_CHARS = 80
+WHOLE_ATTRS = {"class", "id"}
+
+
+def _truncate(text, limit):
+    if text is None:
+        return None
+    text = " ".join(text.split())
+    if len(text) > limit:
+        return text[:limit] + "…"
+    return text
+
+
+def _shorten_value(value, limit, cut=False):
+    # drops whole whitespace separated tokens, the first token is kept even when it is longer than limit
+    # cut -> plain cut at limit instead (data-* json has hardly any spaces to split on)
+    if cut:
+        return value[:limit]
+    tokens = value.split()
+    kept, size = [], 0
+    for token in tokens:
+        if kept and size + 1 + len(token) > limit:
+            break
+        kept.append(token)
+        size += len(token) + (1 if size else 0)
+    return " ".join(kept)
+
+
+def _signature(el):
+    return el.tag, el.get("class", "")
+
+
+def _collapse_repeats(parent, keep):
+    run_sig, run = None, []
+    runs = []
+    for child in parent:
+        if not isinstance(child.tag, str):
+            continue
+        sig = _signature(child)
+        if sig != run_sig:
+            if len(run) > keep:
+                runs.append(run)
+            run_sig, run = sig, []
+        run.append(child)
+    if len(run) > keep:
+        runs.append(run)
+
+    for run in runs:
+        extra = run[keep:]
+        note = etree.Comment(f" {len(extra)} more <{run[0].tag}> like the one above ")
+        extra[0].addprevious(note)
+        for el in extra:
+            # keep the text that followed the removed element
+            if el.tail and el.tail.strip():
+                note.tail = (note.tail or "") + el.tail
+            parent.remove(el)
+
+
+def minimize_html(html, keep_repeats=MINIMIZE_KEEP_REPEATS, text_chars=MINIMIZE_TEXT_CHARS):
+    """smaller html with the same selector-relevant structure, the input is returned as is if it cannot be parsed"""
+    if not html or not html.strip():
+        return ""
+    try:
+        doc = lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError) as e:
+        logger.error(f"DOM minimization skipped, unparsable html: {e}")
+        return html
+
+    etree.strip_elements(doc, *DROP_TAGS, etree.Comment, etree.ProcessingInstruction, with_tail=False)
+    body = doc.find("body")
+    root = body if body is not None else doc
+
+    # bottom-up, so nested repeats (cards inside a repeated row) are collapsed before their parents are compared
+    for el in reversed(list(root.iter(tag=etree.Element))):
+        for attr in list(el.attrib):
+            if attr not in KEEP_ATTRS and not attr.startswith("data-"):
+                del el.attrib[attr]
+            elif attr not in WHOLE_ATTRS and len(el.attrib[attr]) > MAX_ATTR_CHARS:
+                el.attrib[attr] = _shorten_value(el.attrib[attr], MAX_ATTR_CHARS, cut=attr.startswith("data-"))
+        el.text = _truncate(el.text, text_chars)
+        el.tail = _truncate(el.tail, text_chars)
+        if len(el) > keep_repeats:
+            _collapse_repeats(el, keep_repeats)
+
+    minimized = lxml_html.tostring(root, encoding="unicode")
+    logger.info(f"DOM minimized for the LLM: {len(html)} -> {len(minimized)} chars")
+    return minimized
@@ -0,0 +1,143 @@
+# compiled product selector extraction
+# selector json is compiled ONCE per run, every page only pays for parsing + matching
+"""
+backends (same output: text of the first match, every text node stripped and joined, "" when no match)
+
+    selectolax -> lexbor parser, fastest, used by "auto" when installed
+    lxml       -> css compiled to xpath once with cssselect
+    bs4        -> BeautifulSoup + precompiled soupsieve selectors (widest css support)
+
+a selector the chosen backend can't compile falls back to bs4 for that field only.
+"""
+import logging
+from bs4 import BeautifulSoup
+import soupsieve
+
+from CSV_Gen.settings import PARSER_BACKEND
+logger = logging.getLogger("selector_discovery")
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # optional
+    LexborHTMLParser = None
+
+try:
+    from lxml import etree, html as lxml_html
+    from cssselect import HTMLTranslator, SelectorError
+except ImportError:  # optional
+    lxml_html = None
+
+# text of these tags is never part of a field value (bs4 get_text skips them too)
+SKIP_TEXT_TAGS = ("script", "style", "template")
+
+
+def available_backends():
+    backends = []
+    if LexborHTMLParser is not None:
+        backends.append("selectolax")
+    if lxml_html is not None:
+        backends.append("lxml")
+    backends.append("bs4")
+    return backends
+
+
+def resolve_backend(backend=PARSER_BACKEND):
+    backend = (backend or "auto").lower()
+    available = available_backends()
+    if backend == "auto":
+        return available[0]
+    if backend not in available:
+        logger.error(f"Parser backend {backend} not installed, using {available[0]}")
+        return available[0]
+    return backend
+
+
+def _lxml_text(el):
+    parts = []
+
+    def walk(node):
+        if node.text:
+            parts.append(node.text.strip())
+        for child in node:
+            if isinstance(child.tag, str) and child.tag not in SKIP_TEXT_TAGS:
+                walk(child)
+            if child.tail:
+                parts.append(child.tail.strip())
+
+    walk(el)
+    return "".join(parts)
+
+
+class CompiledSelectors:
+    """
+    extractor = compile_selectors(product_selectors)
+    row = extractor.extract(html)   -> {field: text}
+    """
+
+    def __init__(self, selectors, backend=PARSER_BACKEND):
+        self.backend = resolve_backend(backend)
+        self.fields = list(selectors.keys())
+        self.selectors = dict(selectors)
+        self._native = {}     # field -> compiled selector for self.backend
+        self._fallback = {}   # field -> soupsieve pattern
+
+        for field, selector in selectors.items():
+            if not selector or not isinstance(selector, str):
+                continue
+            try:
+                self._native[field] = self._compile(selector)
+                continue
+            except Exception as e:
+                if self.backend != "bs4":
+                    logger.error(f"{self.backend} can't compile '{selector}' ({field}): {e}, using bs4")
+            try:
+                self._fallback[field] = soupsieve.compile(selector)
+            except Exception as e:
+                logger.error(f"Invalid selector '{selector}' for {field}: {e}")
+
+    def _compile(self, selector):
+        if self.backend == "selectolax":
+            # lexbor compiles per query, an empty document tells us now if it can parse it
+            LexborHTMLParser("<html></html>").css_first(selector)
+            return selector
+        if self.backend == "lxml":
+            try:
+                return etree.XPath(HTMLTranslator().css_to_xpath(selector))
+            except SelectorError as e:
+                raise ValueError(str(e))
+        return soupsieve.compile(selector)
+
+    def extract(self, html):
+        data = {field: "" for field in self.fields}
+
+        if self._native:
+            if self.backend == "selectolax":
+                tree = LexborHTMLParser(html)
+                tree.strip_tags(list(SKIP_TEXT_TAGS))
+                for field, selector in self._native.items():
+                    node = tree.css_first(selector)
+                    data[field] = node.text(deep=True, separator="", strip=True) if node is not None else ""
+            elif self.backend == "lxml":
+                doc = lxml_html.document_fromstring(html) if html.strip() else None
+                for field, xpath in self._native.items():
+                    found = xpath(doc) if doc is not None else []
+                    data[field] = _lxml_text(found[0]) if found else ""
+            else:
+                soup = BeautifulSoup(html, "html.parser")
+                self._select_bs4(soup, self._native, data)
+
+        if self._fallback:
+            soup = BeautifulSoup(html, "html.parser")
+            self._select_bs4(soup, self._fallback, data)
+
+        return data
+
+    @staticmethod
+    def _select_bs4(soup, patterns, data):
+        for field, pattern in patterns.items():
+            el = pattern.select_one(soup)
+            data[field] = el.get_text(strip=True) if el else ""
+
+
+def compile_selectors(selectors, backend=PARSER_BACKEND):
+    return CompiledSelectors(selectors, backend)
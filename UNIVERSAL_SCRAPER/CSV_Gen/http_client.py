@@ -0,0 +1,128 @@
+# pooled async http client (keep-alive, bounded connections, retries)
+# for the plain http work of the scrapers: sitemaps, robots.txt, server rendered pages
+import asyncio
+import random
+import logging
+from contextlib import nullcontext
+import aiohttp
+
+from CSV_Gen.rate_limit import Ticket, THROTTLE_STATUS
+from CSV_Gen.settings import HTTP_CONCURRENCY, HTTP_PER_HOST, HTTP_RETRIES, HTTP_TIMEOUT
+logger = logging.getLogger("selector_discovery")
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "en-US,en;q=0.9"
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class HttpResponse:
+    """body is read fully, so the connection is back in the pool when the caller gets this (headers are case-insensitive)"""
+
+    def __init__(self, url, status, headers, body, charset=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.charset = charset
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    @property
+    def text(self):
+        return self.body.decode(self.charset or "utf-8", errors="replace")
+
+
+class HttpClient:
+    """
+    One aiohttp session for a whole run.
+
+    concurrency -> max open connections, per_host -> max open connections to one host
+    retries     -> extra attempts on network errors and 429/5xx (exponential backoff, Retry-After honoured)
+    limiter     -> shared RateLimiter, every attempt takes a slot of its host and reports the status
+
+    usage:
+        async with HttpClient() as client:
+            resp = await client.get(url)
+    """
+
+    def __init__(self, concurrency=HTTP_CONCURRENCY, per_host=HTTP_PER_HOST,
+                 retries=HTTP_RETRIES, timeout=HTTP_TIMEOUT, headers=None, limiter=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.timeout = timeout
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.limiter = limiter
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get(self, url, headers=None):
+        """last response is returned even with a 4xx/5xx status, raises only when every attempt failed on the network"""
+        attempt = 0
+        while True:
+            try:
+                async with self._slot(url) as ticket:
+                    async with self._session.get(url, headers=headers, allow_redirects=True) as resp:
+                        body = await resp.read()
+                        result = HttpResponse(str(resp.url), resp.status, resp.headers.copy(), body, resp.charset)
+                    ticket.status = result.status
+                    ticket.retry_after = self._retry_after(result.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise
+                logger.error(f"GET {url} failed ({e}), retry {attempt + 1}/{self.retries}")
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            if result.status not in RETRY_STATUS or attempt >= self.retries:
+                return result
+            logger.error(f"GET {url} -> {result.status}, retry {attempt + 1}/{self.retries}")
+            # the limiter already paused / slowed the host on a 429 / 503
+            if self.limiter is None or result.status not in THROTTLE_STATUS:
+                await asyncio.sleep(self._backoff(attempt, result.headers.get("Retry-After")))
+            attempt += 1
+
+    def _slot(self, url):
+        if self.limiter is None:
+            return nullcontext(Ticket())
+        return self.limiter.slot(url)
+
+    @staticmethod
+    def _retry_after(value):
+        return int(value) if value and value.isdigit() else None
+
+    @staticmethod
+    def _backoff(attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), 60)
+        return min(2 ** attempt, 30) + random.random()
@@ -0,0 +1,224 @@
+# persistent page cache for rendered html
+# so re-running a domain / selector generation doesn't re-render every page
+"""
+folder structure
+
+base_dir
+    cache
+        pages
+            index.sqlite        -> key -> blob, fetched_at, last_access, etag, last_modified
+            blobs
+                ab
+                    ab12...ef.html.gz   (sha256 of the html, shared by every key with the same content)
+
+key = sha256(normalized url + render options), so a render with other options is a different entry.
+"""
+import os
+import gzip
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+import hashlib
+import logging
+from pathlib import Path
+import aiohttp
+
+from CSV_Gen.http_client import HttpClient
+from CSV_Gen.url_canon import canonical_url
+from CSV_Gen.settings import PAGE_CACHE_TTL, PAGE_CACHE_MAX_MB
+logger = logging.getLogger("selector_discovery")
+
+
+def normalize_cache_url(url):
+    """same spelling the scrapers dedupe on (url_canon.canonical_url)"""
+    return canonical_url(url)
+
+
+def cache_key(url, options=None):
+    raw = normalize_cache_url(url) + "\n" + json.dumps(options or {}, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _header(headers, name):
+    if not headers:
+        return None
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class PageCache:
+    """
+    await get(url, options)  -> cached html or None (fresh, or stale but revalidated with a 304)
+    put(url, options, html, headers) -> stores the render, evicts least recently used above max size
+
+    ttl       -> seconds an entry is served as is
+    revalidate -> after ttl, ask the site with If-None-Match / If-Modified-Since before giving up the entry
+    client    -> shared HttpClient of the run, revalidation requests go through it (and its RateLimiter),
+                 without one a client is opened for the request
+
+    size is counted per blob, a blob shared by several urls counts once
+    safe to share between threads (async callers run put with asyncio.to_thread)
+    """
+
+    def __init__(self, base_dir, ttl=PAGE_CACHE_TTL, max_mb=PAGE_CACHE_MAX_MB, revalidate=True, client=None):
+        self.root = Path(base_dir) / "cache" / "pages"
+        self.blob_dir = self.root / "blobs"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = int(max_mb) * 1024 * 1024
+        self.revalidate = revalidate
+        self.client = client
+
+        self.db = sqlite3.connect(self.root / "index.sqlite", timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                blob TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries(last_access)")
+        self.db.commit()
+        self._lock = threading.Lock()
+        self._bytes = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY blob)"
+        ).fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _blob_path(self, digest):
+        return self.blob_dir / digest[:2] / f"{digest}.html.gz"
+
+    async def get(self, url, options=None):
+        key = cache_key(url, options)
+        row = await asyncio.to_thread(self._entry, key)
+        if not row:
+            return None
+        digest, fetched_at, etag, last_modified = row
+
+        stale = time.time() - fetched_at > self.ttl
+        if stale and not (self.revalidate and await self._not_modified(url, etag, last_modified)):
+            return None
+        return await asyncio.to_thread(self._read, key, url, digest, stale)
+
+    def _entry(self, key):
+        with self._lock:
+            return self.db.execute(
+                "SELECT blob, fetched_at, etag, last_modified FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _read(self, key, url, digest, stale):
+        now = time.time()
+        try:
+            html = gzip.decompress(self._blob_path(digest).read_bytes()).decode("utf-8")
+        except (OSError, EOFError) as e:
+            logger.error(f"Page cache blob unreadable for {url}: {e}")
+            with self._lock:
+                self._delete(key)
+                self.db.commit()
+            return None
+
+        with self._lock:
+            if stale:
+                self.db.execute("UPDATE entries SET fetched_at = ? WHERE key = ?", (now, key))
+            self.db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return html
+
+    def put(self, url, options, html, headers=None):
+        if not html:
+            return
+        key = cache_key(url, options)
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(digest)
+
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(gzip.compress(data, compresslevel=5))
+            os.replace(tmp, blob_path)
+        size = blob_path.stat().st_size
+
+        with self._lock:
+            self._store(key, url, digest, size, headers)
+
+    def _store(self, key, url, digest, size, headers):
+        old = self.db.execute("SELECT blob, size FROM entries WHERE key = ?", (key,)).fetchone()
+        known = self.db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone()
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, normalize_cache_url(url), digest, size, now, now,
+             _header(headers, "etag"), _header(headers, "last-modified"))
+        )
+        if not known:
+            self._bytes += size
+        if old and old[0] != digest and self._drop_blob_if_unused(old[0]):
+            self._bytes -= old[1]
+        self._evict()
+        self.db.commit()
+
+    async def _not_modified(self, url, etag, last_modified):
+        if not etag and not last_modified:
+            return False
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            if self.client is not None:
+                resp = await self.client.get(url, headers=headers)
+            else:
+                async with HttpClient() as client:
+                    resp = await client.get(url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Page cache revalidation failed for {url}: {e}")
+            return False
+        return resp.status == 304
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        rows = self.db.execute("SELECT key FROM entries ORDER BY last_access ASC").fetchall()
+        for (key,) in rows:
+            if self._bytes <= self.max_bytes:
+                break
+            self._delete(key)
+
+    def _delete(self, key):
+        row = self.db.execute("SELECT blob, size FROM entries WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return
+        self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        if self._drop_blob_if_unused(row[0]):
+            self._bytes -= row[1]
+
+    def _drop_blob_if_unused(self, digest):
+        """True when no entry uses the blob any more and it was removed"""
+        in_use = self.db.execute("SELECT 1 FROM entries WHERE blob = ? LIMIT 1", (digest,)).fetchone()
+        if in_use:
+            return False
+        try:
+            self._blob_path(digest).unlink()
+        except FileNotFoundError:
+            pass
+        return True
@@ -0,0 +1,155 @@
+# structural fingerprint of a page (tag/class skeleton, text removed)
+# pages rendered from the same template get the same / a very close fingerprint, so selectors found
+# once (by the llm) can be reused for every other page of that template without a new llm call
+"""
+skeleton feature = root-to-node path of tag.class steps, e.g. body/div.product/div.info/h1
+    - text, attributes other than class, ids and comments are ignored
+    - hashed css-module suffixes are dropped (card__a1b2c3 -> card)
+    - it is a SET, so 12 vs 48 repeated product cards give the same features
+
+digest  -> sha1 of the sorted feature set (exact template match)
+minhash -> 64 minimum hashes of the feature set, compared for near matches (estimated jaccard)
+
+templates are stored per domain in <base_dir>/selectors/<domain>/templates.json
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime
+from lxml import etree, html as lxml_html
+
+from CSV_Gen.settings import TEMPLATE_MATCH_THRESHOLD
+logger = logging.getLogger("selector_discovery")
+
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "link", "meta"}
+MAX_DEPTH = 14
+MAX_CLASSES = 3
+NUM_HASHES = 64
+_MASK64 = (1 << 64) - 1
+# fixed (a, b) pairs of a*h + b mod 2**64, fingerprints must be comparable across runs
+_SEEDS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big"))
+    for i in range(NUM_HASHES)
+]
+_HASHED_SUFFIX = re.compile(r"(?:[-_]{1,2}[a-zA-Z0-9]*\d[a-zA-Z0-9]*)+$")
+_DIGITS = re.compile(r"\d+")
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+def html_document(html):
+    """lxml document of html (str or bytes), None when it can't be parsed.
+    lxml refuses str input with an xml encoding declaration (xhtml served as text/html), it is dropped"""
+    if isinstance(html, str):
+        html = _XML_DECLARATION.sub("", html, count=1)
+    try:
+        return lxml_html.document_fromstring(html)
+    except (etree.ParserError, ValueError) as e:
+        logger.error(f"Unparsable html: {e}")
+        return None
+
+
+def _class_token(name):
+    name = _HASHED_SUFFIX.sub("", name)
+    return _DIGITS.sub("", name)
+
+
+def _step(el):
+    classes = sorted({_class_token(c) for c in (el.get("class") or "").split()} - {""})
+    if classes:
+        return el.tag + "." + ".".join(classes[:MAX_CLASSES])
+    return el.tag
+
+
+def skeleton_features(html):
+    """set of root-to-node tag.class paths of the page body"""
+    if not html or not html.strip():
+        return set()
+    doc = html_document(html)
+    if doc is None:
+        return set()
+    body = doc.find("body")
+    root = body if body is not None else doc
+
+    features = set()
+    stack = [(root, root.tag, 0)]
+    while stack:
+        el, path, depth = stack.pop()
+        features.add(path)
+        if depth >= MAX_DEPTH:
+            continue
+        for child in el:
+            if not isinstance(child.tag, str) or child.tag in SKIP_TAGS:
+                continue
+            stack.append((child, path + "/" + _step(child), depth + 1))
+    return features
+
+
+def fingerprint(html):
+    """(digest, minhash) of the page skeleton"""
+    features = skeleton_features(html)
+    digest = hashlib.sha1("\n".join(sorted(features)).encode("utf-8")).hexdigest()
+
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in features]
+    if not hashes:
+        return digest, [_MASK64] * NUM_HASHES
+    minhash = [min((a * h + b) & _MASK64 for h in hashes) for a, b in _SEEDS]
+    return digest, minhash
+
+
+def similarity(minhash_a, minhash_b):
+    """estimated jaccard similarity of two skeletons"""
+    same = sum(1 for a, b in zip(minhash_a, minhash_b) if a == b)
+    return same / NUM_HASHES
+
+
+class TemplateStore:
+    """
+    store = TemplateStore(base_dir, domain)
+    hit = store.find("product", html)      -> {"selectors":..., "url":..., "score":...} or None
+    store.remember("product", html, selectors, url)
+    """
+
+    def __init__(self, base_dir, domain, threshold=TEMPLATE_MATCH_THRESHOLD):
+        self.path = os.path.join(base_dir, "selectors", domain, "templates.json")
+        self.threshold = threshold
+        self.templates = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.templates = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Unreadable template store {self.path}: {e}")
+
+    def find(self, kind, html):
+        digest, minhash = fingerprint(html)
+        exact = self.templates.get(digest)
+        if exact and exact["kind"] == kind:
+            return dict(exact, score=1.0, digest=digest)
+
+        best, best_score = None, 0.0
+        for key, template in self.templates.items():
+            if template["kind"] != kind:
+                continue
+            score = similarity(minhash, template["minhash"])
+            if score > best_score:
+                best, best_score = dict(template, digest=key), score
+        if best is not None and best_score >= self.threshold:
+            return dict(best, score=best_score)
+        return None
+
+    def remember(self, kind, html, selectors, url):
+        digest, minhash = fingerprint(html)
+        self.templates[digest] = {
+            "kind": kind,
+            "url": url,
+            "selectors": selectors,
+            "minhash": minhash,
+            "saved_at": datetime.now().isoformat(timespec="seconds")
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.templates, f, ensure_ascii=False)
+        return digest
@@ -0,0 +1,80 @@
+# process pool for the parse stage of the scrapers
+# html parsing + selector matching is cpu work, on the event loop it stalls every fetch in flight.
+# pages are handed to worker processes (selectors compiled once per worker), rows come back as plain dicts.
+"""
+parser = ParsePool(product_selectors)
+async with parser:
+    row = await parser.extract(html)
+    fingerprint = await parser.fingerprint(html)     # content_dedupe fingerprint, same workers
+
+workers -> worker processes, 0 = parse inline on the calling thread (old behaviour, small runs)
+queue   -> pages parsing or waiting for a worker; extract() waits when it is full, so the fetch stage
+           slows down instead of piling up html in memory
+"""
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from CSV_Gen.extraction import compile_selectors
+from CSV_Gen.content_dedupe import content_fingerprint
+from CSV_Gen.settings import PARSER_BACKEND, PARSE_WORKERS, PARSE_QUEUE
+logger = logging.getLogger("selector_discovery")
+
+# per worker process
+_extractor = None
+
+
+def _init_worker(selectors, backend):
+    global _extractor
+    _extractor = compile_selectors(selectors, backend)
+
+
+def _extract(html):
+    return _extractor.extract(html)
+
+
+class ParsePool:
+
+    def __init__(self, selectors, backend=PARSER_BACKEND, workers=PARSE_WORKERS, queue=PARSE_QUEUE):
+        # compiled here too: fields / backend for the caller, and the inline path
+        self._local = compile_selectors(selectors, backend)
+        self.fields = self._local.fields
+        self.selectors = self._local.selectors
+        self.backend = self._local.backend
+        self.workers = max(0, int(workers))
+        self._slots = asyncio.Semaphore(max(1, int(queue or self.workers * 2)))
+        self._executor = None
+        if self.workers:
+            # spawn: the parent runs threads (browser driver, to_thread readers), forking those is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(selectors, self.backend)
+            )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    async def extract(self, html):
+        """{field: text} for one page"""
+        if self._executor is None:
+            return self._local.extract(html)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _extract, html)
+
+    async def fingerprint(self, html):
+        """content_fingerprint of one page (duplicate detection), cpu work like extract"""
+        if self._executor is None:
+            return content_fingerprint(html)
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, content_fingerprint, html)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,95 @@
+# async worker pipeline for the csv scrapers
+# many urls in flight, rows still come out in input order so products.csv stays diffable
+import asyncio
+import inspect
+import logging
+from urllib.parse import urlparse
+
+from CSV_Gen.settings import SCRAPE_CONCURRENCY, SCRAPE_PER_HOST
+logger = logging.getLogger("selector_discovery")
+
+
+async def scrape_ordered(urls, fetch, extract, emit,
+                         concurrency=SCRAPE_CONCURRENCY, per_host=SCRAPE_PER_HOST):
+    """
+    urls    -> any iterable or async iterable, consumed lazily (only pulled when a slot is free)
+    fetch   -> async fetch(idx, url) -> html or None
+    extract -> extract(url, html) -> row dict or None (or a coroutine of it), runs as soon as its fetch completes.
+               the fetch slot is free again by then, a slow parse stage limits itself (ParsePool queue)
+    emit    -> emit(idx, url, row), called strictly in input order
+
+    concurrency bounds fetches across all hosts, per_host bounds fetches to one host.
+    Failed urls (no html / exception) are skipped but still advance the order.
+    Returns number of rows emitted.
+    """
+    concurrency = max(1, int(concurrency))
+    per_host = max(1, int(per_host))
+
+    slots = asyncio.Semaphore(concurrency)
+    host_slots = {}
+    # finished rows waiting for an earlier index, capped so one slow url can't grow it forever
+    window = concurrency * 4
+    finished = {}
+    next_idx = 0
+    emitted = 0
+    order = asyncio.Condition()
+    tasks = set()
+
+    async def work(idx, url):
+        nonlocal next_idx, emitted
+        row = None
+        html = None
+        try:
+            host = urlparse(url).hostname or ""
+            host_sem = host_slots.setdefault(host, asyncio.Semaphore(per_host))
+            async with host_sem:
+                html = await fetch(idx, url)
+        except Exception as e:
+            logger.error(f"pipeline error for {url}: {e}")
+        finally:
+            slots.release()
+
+        if html:
+            try:
+                row = extract(url, html)
+                if inspect.isawaitable(row):
+                    row = await row
+            except Exception as e:
+                logger.error(f"extract error for {url}: {e}")
+
+        async with order:
+            finished[idx] = (url, row)
+            while next_idx in finished:
+                done_url, done_row = finished.pop(next_idx)
+                if done_row is not None:
+                    emit(next_idx, done_url, done_row)
+                    emitted += 1
+                next_idx += 1
+            order.notify_all()
+
+    async def source():
+        if hasattr(urls, "__aiter__"):
+            async for url in urls:
+                yield url
+        else:
+            for url in urls:
+                yield url
+
+    idx = -1
+    try:
+        async for url in source():
+            idx += 1
+            async with order:
+                await order.wait_for(lambda: idx - next_idx < window)
+            await slots.acquire()
+            task = asyncio.create_task(work(idx, url))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    return emitted
@@ -0,0 +1,286 @@
+# adaptive per-host politeness for the scrapers
+# a steady rate the site tolerates beats bursts that end in 429s, captchas or a ban
+"""
+every request to a host goes through limiter.slot(url) (HttpClient.get and BrowserPool.arun do this):
+
+    concurrency per host moves AIMD
+        success at normal latency      -> limit += 1 / limit   (about +1 per round of requests)
+        429 / 503                      -> limit halves, spacing between starts doubles,
+                                          Retry-After pauses the host
+        latency > RATE_LATENCY_FACTOR x the host's best latency, or network error -> limit x 0.75
+      at most one decrease per latency window, so a burst of 429s from one round counts once
+
+    starts are spaced by at least the robots.txt Crawl-delay / Request-rate of the host,
+    robots.txt is fetched once per host and cached (ROBOTS_TTL). Crawl-delay is read as a float
+    ("0.5", "2.5"), the stdlib parser only takes whole seconds
+
+    spacing=fn(host, interval) -> seconds to wait, for limiters in several processes crawling the same
+    hosts: fn reserves the next start in storage they share (frontier.Frontier.reserve_host), it may
+    block and runs in a thread
+
+limiter.snapshot() -> {host: {"limit", "in_flight", "interval", "latency_ms", "rps", "ok", "throttled", "crawl_delay"}}
+"""
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import requests
+
+from CSV_Gen.settings import (
+    SCRAPE_PER_HOST, RATE_START_LIMIT, RATE_LATENCY_FACTOR, RATE_MAX_INTERVAL, ROBOTS_TTL, ROBOTS_MAX_DELAY
+)
+logger = logging.getLogger("selector_discovery")
+
+THROTTLE_STATUS = {429, 503}
+ROBOTS_USER_AGENT = "*"
+RPS_WINDOW = 60
+
+# scheme://host -> (fetched_at, RobotFileParser or None, {agent: crawl delay}), shared by every limiter of the process
+_robots = {}
+_robots_lock = threading.Lock()
+
+_ROBOTS_LINE = re.compile(r"^\s*([A-Za-z-]+)\s*:\s*([^#]*)")
+
+
+def crawl_delays(text):
+    """{user agent (lower case): Crawl-delay seconds as float} of a robots.txt, groups as RobotFileParser reads them"""
+    delays = {}
+    agents, in_rules = [], False
+    for line in text.splitlines():
+        match = _ROBOTS_LINE.match(line)
+        if not match:
+            continue
+        field, value = match.group(1).lower(), match.group(2).strip()
+        if field == "user-agent":
+            # a user-agent line after rules starts a new group
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+        elif agents:
+            in_rules = True
+            if field == "crawl-delay":
+                try:
+                    delay = float(value)
+                except ValueError:
+                    continue
+                if delay >= 0:
+                    for agent in agents:
+                        delays.setdefault(agent, delay)
+    return delays
+
+
+def _robots_entry(url, timeout=10, ttl=ROBOTS_TTL):
+    parsed = urlparse(url)
+    origin = f"{parsed.scheme or 'https'}://{parsed.netloc}"
+    with _robots_lock:
+        cached = _robots.get(origin)
+    if cached and time.time() - cached[0] < ttl:
+        return cached
+
+    parser, delays = None, {}
+    try:
+        resp = requests.get(f"{origin}/robots.txt", timeout=timeout, headers={"User-Agent": "Mozilla/5.0"})
+        if resp.status_code < 400:
+            parser = RobotFileParser()
+            parser.parse(resp.text.splitlines())
+            delays = crawl_delays(resp.text)
+    except requests.RequestException as e:
+        logger.error(f"robots.txt unavailable for {origin}: {e}")
+
+    entry = (time.time(), parser, delays)
+    with _robots_lock:
+        _robots[origin] = entry
+    return entry
+
+
+def robots_for(url, timeout=10, ttl=ROBOTS_TTL):
+    """parsed robots.txt of the url's host (cached), None when the site has none"""
+    return _robots_entry(url, timeout, ttl)[1]
+
+
+def crawl_delay(url, user_agent=ROBOTS_USER_AGENT):
+    """seconds between requests the host asks for (Crawl-delay or Request-rate), 0 when it asks nothing"""
+    _, parser, delays = _robots_entry(url)
+    if parser is None:
+        return 0.0
+    agent = user_agent.lower()
+    delay = delays.get(agent, delays.get("*"))
+    if delay is None:
+        delay = float(parser.crawl_delay(user_agent) or 0)
+    rate = parser.request_rate(user_agent)
+    if rate and rate.requests:
+        delay = max(delay, rate.seconds / rate.requests)
+    if delay > ROBOTS_MAX_DELAY:
+        logger.error(f"Crawl-delay {delay}s of {urlparse(url).netloc} capped at {ROBOTS_MAX_DELAY}s")
+        delay = ROBOTS_MAX_DELAY
+    return delay
+
+
+class Ticket:
+    """filled in by the caller inside limiter.slot(): status (None = network error) and Retry-After"""
+
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+
+
+class _Host:
+
+    def __init__(self, max_limit, start_limit, delay):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(min(max(1, start_limit), self.max_limit))
+        self.crawl_delay = delay
+        self.interval = delay
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.latency = None
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.finished = deque()
+        self.ok = 0
+        self.throttled = 0
+        self.cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.cond:
+            while True:
+                now = time.monotonic()
+                free = self.in_flight < int(self.limit)
+                ready_at = max(self.next_start, self.paused_until)
+                if free and now >= ready_at:
+                    self.in_flight += 1
+                    self.next_start = now + self.interval
+                    return
+                timeout = ready_at - now if free else None
+                try:
+                    await asyncio.wait_for(self.cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, status, latency, retry_after, latency_factor):
+        async with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            self.finished.append(now)
+            while self.finished and now - self.finished[0] > RPS_WINDOW:
+                self.finished.popleft()
+
+            if status in THROTTLE_STATUS:
+                self.throttled += 1
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + min(retry_after, 300))
+                if self._decrease(0.5, now):
+                    self.interval = min(max(self.interval * 2, self.crawl_delay, 0.25), RATE_MAX_INTERVAL)
+            elif status is None:
+                self._decrease(0.75, now)
+            else:
+                self.ok += 1
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                # best latency drifts up slowly, a server that got slower for good isn't punished forever
+                self.best_latency = self.latency if self.best_latency is None else min(self.best_latency * 1.01, self.latency)
+                if self.ok > 5 and self.latency > latency_factor * self.best_latency:
+                    self._decrease(0.75, now)
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    # spacing added after a throttle fades out, the crawl delay stays
+                    extra = (self.interval - self.crawl_delay) * 0.8
+                    self.interval = self.crawl_delay + (extra if extra > 0.005 else 0.0)
+            self.cond.notify_all()
+
+    def _decrease(self, factor, now):
+        # one decrease per latency window (at least a second)
+        if now - self.last_decrease < max(1.0, self.latency or 0):
+            return False
+        self.last_decrease = now
+        self.limit = max(1.0, self.limit * factor)
+        return True
+
+    def snapshot(self):
+        now = time.monotonic()
+        span = min(RPS_WINDOW, now - self.finished[0]) if self.finished else 0
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "interval": round(self.interval, 3),
+            "latency_ms": round(self.latency * 1000) if self.latency is not None else None,
+            "rps": round(len(self.finished) / span, 2) if span > 0 else 0.0,
+            "ok": self.ok,
+            "throttled": self.throttled,
+            "crawl_delay": self.crawl_delay
+        }
+
+
+class RateLimiter:
+    """
+    limiter = RateLimiter(max_per_host, spacing=None)
+    async with limiter.slot(url) as ticket:
+        resp = ...
+        ticket.status = resp.status
+    """
+
+    def __init__(self, max_per_host=SCRAPE_PER_HOST, start_limit=RATE_START_LIMIT,
+                 latency_factor=RATE_LATENCY_FACTOR, respect_robots=True, spacing=None):
+        self.max_per_host = max_per_host
+        self.spacing = spacing
+        self.start_limit = start_limit
+        self.latency_factor = latency_factor
+        self.respect_robots = respect_robots
+        self.hosts = {}
+        self._pending = {}   # netloc -> task reading its robots.txt, first requests to a host wait on it
+
+    async def _new_host(self, netloc, url):
+        try:
+            delay = await asyncio.to_thread(crawl_delay, url) if self.respect_robots else 0.0
+            if delay:
+                logger.info(f"{netloc}: robots.txt asks for {delay}s between requests")
+            host = self.hosts[netloc] = _Host(self.max_per_host, self.start_limit, delay)
+            return host
+        finally:
+            self._pending.pop(netloc, None)
+
+    async def _host(self, url):
+        # one robots.txt fetch per host, a slow one only holds up requests to that host
+        netloc = urlparse(url).netloc
+        host = self.hosts.get(netloc)
+        if host is not None:
+            return host
+        pending = self._pending.get(netloc)
+        if pending is None:
+            pending = self._pending[netloc] = asyncio.ensure_future(self._new_host(netloc, url))
+        # shielded: a cancelled request doesn't cancel the fetch the other requests wait on
+        return await asyncio.shield(pending)
+
+    @asynccontextmanager
+    async def slot(self, url):
+        host = await self._host(url)
+        await host.acquire()
+        ticket = Ticket()
+        started = time.monotonic()
+        try:
+            if self.spacing is not None and host.interval > 0:
+                # other processes start requests to this host too, the shared reservation decides
+                wait = await asyncio.to_thread(self.spacing, urlparse(url).netloc, host.interval)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                started = time.monotonic()
+            yield ticket
+        finally:
+            await host.release(ticket.status, time.monotonic() - started, ticket.retry_after, self.latency_factor)
+
+    def snapshot(self):
+        return {netloc: host.snapshot() for netloc, host in self.hosts.items()}
+
+    def summary(self):
+        lines = []
+        for netloc, s in self.snapshot().items():
+            lines.append(
+                f"{netloc}: {s['rps']} req/s, limit {s['limit']}, {s['interval']}s spacing, "
+                f"{s['latency_ms']} ms, {s['ok']} ok / {s['throttled']} throttled"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,138 @@
+# incremental csv writer for the scrapers
+# rows go to disk as they are scraped, so memory stays flat and a crashed run still leaves a usable csv
+import os
+import csv
+import logging
+from pathlib import Path
+
+from CSV_Gen.settings import CSV_BATCH_SIZE, CSV_FSYNC_EVERY
+logger = logging.getLogger("selector_discovery")
+
+
+def product_fieldnames(product_selectors):
+    """csv header fixed up front from the selector schema"""
+    return [field for field in product_selectors if field != "url"] + ["url"]
+
+
+class CsvRowWriter:
+    """
+    with CsvRowWriter(path, fieldnames) as writer:
+        writer.write(row)
+
+    the file is only created on the first row (no rows -> no csv, same as before).
+    rows are written every batch_size rows and fsynced every fsync_every rows.
+    append=True keeps an existing file and its header (resumed runs).
+    on_flush() is called every time buffered rows reached the file (FanoutWriter has its own for the journal).
+    """
+
+    def __init__(self, path, fieldnames, batch_size=CSV_BATCH_SIZE, fsync_every=CSV_FSYNC_EVERY, append=False,
+                 on_flush=None):
+        self.path = Path(path)
+        self.fieldnames = list(fieldnames)
+        self.batch_size = max(1, batch_size)
+        self.fsync_every = fsync_every
+        self.append = append
+        self.on_flush = on_flush
+        self.count = 0
+
+        self._file = None
+        self._writer = None
+        self._buffer = []
+        self._since_fsync = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keep = self.append and self.path.exists() and self.path.stat().st_size > 0
+        self._file = self.path.open("a" if keep else "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction="ignore")
+        if not keep:
+            self._writer.writeheader()
+
+    def write(self, row):
+        self._buffer.append(row)
+        self.count += 1
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self, sync=False):
+        if self._buffer:
+            if self._file is None:
+                self._open()
+            self._writer.writerows(self._buffer)
+            self._since_fsync += len(self._buffer)
+            self._buffer = []
+        if self._file is not None:
+            self._file.flush()
+            if sync or (self.fsync_every and self._since_fsync >= self.fsync_every):
+                os.fsync(self._file.fileno())
+                self._since_fsync = 0
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def close(self):
+        self.flush(sync=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FanoutWriter:
+    """
+    hands every row to several writers (csv + parquet), count is the number of rows written.
+
+    the fanout decides when rows go to disk: every batch_size rows (default: the smallest batch of its
+    writers) all writers are flushed together and only then on_flush() is called. a writer with bigger
+    files (parquet parts) may keep rows until its file is full, on resume it refills them from the csv.
+    """
+
+    def __init__(self, writers, batch_size=None, on_flush=None):
+        self.writers = list(writers)
+        self.batch_size = max(1, batch_size or min(getattr(writer, "batch_size", 1) for writer in self.writers))
+        self.on_flush = on_flush
+        self.count = 0
+        self._buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, row):
+        for writer in self.writers:
+            writer.write(row)
+        self.count += 1
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self, sync=False):
+        for writer in self.writers:
+            writer.flush(sync)
+        self._buffered = 0
+        if self.on_flush is not None:
+            self.on_flush()
+
+    def close(self):
+        # rows are committed only when every writer flushed them, the first error is raised after
+        # every writer had its chance to close
+        error = None
+        try:
+            self.flush(sync=True)
+        except Exception as e:
+            logger.error(f"Flushing rows failed: {e}")
+            error = e
+        for writer in self.writers:
+            try:
+                writer.close()
+            except Exception as e:
+                logger.error(f"Closing {getattr(writer, 'path', writer)} failed: {e}")
+                error = error or e
+        if error is not None:
+            raise error
@@ -10,9 +10,15 @@ import logging
 logger = logging.getLogger("selector_discovery")
 import json
 import base64
+import asyncio
+import threading
+from lxml import etree, html as lxml_html
 
 
 from crawl4ai import async_webcrawler, CrawlerRunConfig
+from CSV_Gen.page_cache import PageCache
+from CSV_Gen.capture import encode_screenshot
+from CSV_Gen.settings import PAGE_CACHE_ENABLED
 
 def normalize_url(url: str) -> str:
         return url.replace("://", "_").replace("/", "_").replace("?", "_").replace("&", "_").replace("=", "_")
@@ -22,10 +28,15 @@ def ensure_dir(path):
     """Create directory if it doesn't exist"""
     os.makedirs(path, exist_ok=True)
 
-# This Html collection is for csv gen scripts 
-async def html_collection(url,base_dir='/data/web'):
+# render options of html_collection, also part of the page cache key
+RENDER_OPTIONS = {
+    "scan_full_page": True,
+    "scroll_delay": 0.5,
+    "remove_overlay_elements": True
+}
 
-    EXCLUDED_TAGS = [
+# tags dropped from the clean html (same list crawl4ai used to get as excluded_tags)
+EXCLUDED_TAGS = [
     "script",
     "style",
     "noscript",
@@ -34,155 +45,222 @@ async def html_collection(url,base_dir='/data/web'):
     "canvas",
     "link",
     "meta"
-    ]
+]
+
+
+def strip_excluded_tags(html, tags=EXCLUDED_TAGS):
+    """Build the clean html locally from an already rendered page (lxml, no second render)"""
+    if not html or not html.strip():
+        return ""
+    doc = lxml_html.document_fromstring(html)
+    etree.strip_elements(doc, *tags, with_tail=False)
+    return lxml_html.tostring(doc, encoding="unicode", doctype="<!DOCTYPE html>")
+
+
+def save_collected_html(url, base_dir, html, kind="raw"):
+    """writes <base_dir>/<kind>/<date>/<domain>/html/<slug>.html, kind is raw or clean_html"""
+    today = datetime.now(ZoneInfo("Asia/Kolkata")).date().isoformat()
+    domain = urlparse(url).hostname or "unknown"
+    path = urlparse(url).path.strip("/")
+    slug = path.replace("/", "_") if path else "root"
+
+    out_dir = os.path.join(base_dir, kind, today, domain, "html")
+    ensure_dir(out_dir)
+    out_path = os.path.join(out_dir, f"{slug}.html")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(html)
+    return out_path
+
+
+async def cached_render(url, base_dir, pool=None, cache=None, use_cache=PAGE_CACHE_ENABLED):
+    """raw rendered html of url, served from the page cache when possible"""
+    own_cache = None
+    if use_cache and cache is None:
+        cache = own_cache = PageCache(base_dir)
+    try:
+        if use_cache:
+            html = await cache.get(url, RENDER_OPTIONS)
+            if html:
+                logger.info(f"Page cache hit: {url}")
+                return html
+
+        # crawl4ai's own cache stays bypassed, the page cache sits in front of it
+        run_cfg = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, **RENDER_OPTIONS)
+        if pool is not None:
+            raw = await pool.arun(url, config=run_cfg)
+        else:
+            browser_cfg = BrowserConfig(headless=True)
+            async with AsyncWebCrawler(config=browser_cfg) as crawler:
+                raw = await crawler.arun(url, config=run_cfg)
+
+        if not raw or not raw.html:
+            return None
+        if use_cache and raw.success:
+            await asyncio.to_thread(cache.put, url, RENDER_OPTIONS, raw.html, raw.response_headers)
+        return raw.html
+    finally:
+        if own_cache is not None:
+            own_cache.close()
 
+
+# This Html collection is for csv gen scripts 
+async def html_collection(url,base_dir='/data/web',pool=None,save_raw=True,save_clean=True,
+                          cache=None,use_cache=PAGE_CACHE_ENABLED):
+    """
+    Renders the url ONCE and saves raw + clean html.
+
+    pool       -> shared BrowserPool of a scraper run, without it a browser is opened for this url only
+    save_raw   -> write raw/<date>/<domain>/html/<slug>.html
+    save_clean -> build + write clean_html/<date>/<domain>/html/<slug>.html
+    cache      -> shared PageCache of a scraper run, without it base_dir/cache/pages is opened for this call
+    use_cache  -> False always renders (cache is neither read nor written)
+
+    returns the clean html, or the raw html when save_clean=False / cleaning failed
+    """
     try:
-        today = datetime.datetime.now(ZoneInfo("Asia/Kolkata")).date().isoformat()
         domain = urlparse(url).hostname or "unknown"
-        raw_dir = os.path.join(base_dir, "raw", today, domain, "html")
-        clean_dir = os.path.join(base_dir, "clean_html", today, domain, "html")
-        ensure_dir(raw_dir)
-        ensure_dir(clean_dir)
-        path = urlparse(url).path.strip("/")
-        slug = path.replace("/", "_") if path else "root"
-        raw_path = os.path.join(raw_dir, f"{slug}.html")
-        clean_path = os.path.join(clean_dir, f"{slug}.html")
-
-        browser_cfg = BrowserConfig(headless=True)
-
-
-        run_cfg = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            scan_full_page=True,
-            scroll_delay=0.5,
-            remove_overlay_elements=True
-        )
-        clean_cfg = CrawlerRunConfig(
-                    cache_mode=CacheMode.BYPASS,
-                    scan_full_page=True,
-                    scroll_delay=0.5,
-                    remove_overlay_elements=True,
-                    excluded_tags=EXCLUDED_TAGS
-                )
-        
-
-
-        async with AsyncWebCrawler(config=browser_cfg) as crawler:
-            raw = await crawler.arun(url, config=run_cfg)
-            clean= await crawler.arun(url, config=clean_cfg)
-
-        if not clean or not clean.html:
-            logger.error(f"Clean HTML fetch failed: {url}")
-            if not raw or not raw.html:
-                logger.error(f"Failed to fetch HTML: {url}")
-                return None
-            else:
-                return raw.html
-
-
-        with open(raw_path, "w", encoding="utf-8") as f:
-            f.write(raw.html or "")
-
-        with open(clean_path, "w", encoding="utf-8") as f:
-            f.write(clean.html)
-        logger.info(f"HTML saved → RAW + CLEAN for {domain}")
-        return clean.html
+
+        raw_html = await cached_render(url, base_dir, pool, cache, use_cache)
+        if not raw_html:
+            logger.error(f"Failed to fetch HTML: {url}")
+            return None
+
+        if save_raw:
+            save_collected_html(url, base_dir, raw_html, "raw")
+
+        if not save_clean:
+            logger.info(f"HTML saved → RAW for {domain}")
+            return raw_html
+
+        try:
+            clean = strip_excluded_tags(raw_html)
+        except Exception as e:
+            logger.error(f"Clean HTML build failed: {url}: {e}")
+            return raw_html
+
+        save_collected_html(url, base_dir, clean, "clean_html")
+        logger.info(f"HTML saved → {'RAW + ' if save_raw else ''}CLEAN for {domain}")
+        return clean
     
     except Exception as e:
         logger.error(f"html_collection error for {url}: {e}")
         return None
 
-# This Html collection is for crawler scripts 
-def html_default(url,base_dir,html):
-    if not html:
-        return
-    
-    date = datetime.now().strftime("%Y-%m-%d")
-    parsed = urlparse(url)
-    domain_folder = parsed.netloc.replace(".", "_")
+# This Html collection is for crawler scripts
+# Data/<date>/<domain>/<folder>/<page>.<ext>, folder + extension per artifact
+CRAWL_ARTIFACTS = {
+    "html": ("html", ".html"),
+    "markdown": ("markdown", ".md"),
+    "screenshot": ("screenshots", ".png"),
+    "metadata": ("metadata", ".json"),
+    "pdf": ("PDF", ".pdf"),
+    "json": ("JSON", ".json")
+}
+
+# folders already created by this process, mkdir runs once per folder instead of once per file
+_made_dirs = set()
+
+
+def _cached_dir(path):
+    if path not in _made_dirs:
+        path.mkdir(parents=True, exist_ok=True)
+        _made_dirs.add(path)
+    return path
 
-    # Normalize page URL for folder name
-    page_folder = normalize_url(url)
 
-    # Build the path
-    html_dir = Path(base_dir) / "Data" / date / domain_folder / "html"
+class PagePath:
+    """where the artifacts of one crawled url go, date / domain / page name resolved once"""
 
-    # Create directories if not exist
-    html_dir.mkdir(parents=True, exist_ok=True)
+    def __init__(self, url, base_dir):
+        date = datetime.now().strftime("%Y-%m-%d")
+        domain_folder = urlparse(url).netloc.replace(".", "_")
+        self.root = Path(base_dir) / "Data" / date / domain_folder
+        self.name = normalize_url(url)
 
-    # Save HTML file
-    file_path = html_dir / f"{page_folder}.html"
-    file_path.write_text(html, encoding="utf-8")
+    def file(self, artifact, ext=None):
+        folder, default_ext = CRAWL_ARTIFACTS[artifact]
+        return _cached_dir(self.root / folder) / f"{self.name}{ext or default_ext}"
 
-def markdown_collection(url,base_dir,markdowns):
+
+def html_default(url,base_dir,html,page=None):
+    if not html:
+        return
+    page = page or PagePath(url, base_dir)
+    page.file("html").write_text(html, encoding="utf-8")
+
+def markdown_collection(url,base_dir,markdowns,page=None):
     if not markdowns:
         return
-    date = datetime.now().strftime("%Y-%m-%d")
-    parsed = urlparse(url)
-    domain_folder = parsed.netloc.replace(".", "_")
-    page_folder = normalize_url(url)
-    markdown_dir = Path(base_dir) / "Data" / date / domain_folder / "markdown"
-    markdown_dir.mkdir(parents=True, exist_ok=True)
-    file_path = markdown_dir / f"{page_folder}.md"
-    file_path.write_text(markdowns, encoding="utf-8")
+    page = page or PagePath(url, base_dir)
+    page.file("markdown").write_text(markdowns, encoding="utf-8")
 
 
-def screenshot_data(url, base_dir, screenshot_str):
+def screenshot_data(url, base_dir, screenshot_str, page=None):
     if not screenshot_str:
         return
-    try:
-        screenshot_bytes = base64.b64decode(screenshot_str)
-    except Exception as e:
-        print(f"[ERROR] Failed to decode screenshot for {url}: {e}")
+    # png from crawl4ai, re-encoded to CAPTURE_IMAGE_FORMAT
+    encoded = encode_screenshot(screenshot_str)
+    if encoded is None:
+        print(f"[ERROR] Failed to decode screenshot for {url}")
         return
-    parsed = urlparse(url)
-    domain_folder = parsed.netloc.replace(".", "_")
-    date = datetime.now().strftime("%Y-%m-%d")
-    page_folder = normalize_url(url)
-    screenshot_dir = Path(base_dir) / "Data" / date / domain_folder / "screenshots"
-    screenshot_dir.mkdir(parents=True, exist_ok=True)
-    file_path = screenshot_dir / f"{page_folder}.png"
-    with open(file_path, "wb") as f:
-        f.write(screenshot_bytes)
-
+    screenshot_bytes, ext, _ = encoded
+    page = page or PagePath(url, base_dir)
+    page.file("screenshot", ext).write_bytes(screenshot_bytes)
 
 
-
-def metadata_data(url,base_dir,meta):
+def metadata_data(url,base_dir,meta,page=None):
     if not meta:
         return
-    date = datetime.now().strftime("%Y-%m-%d")
-    parsed = urlparse(url)
-    domain_folder = parsed.netloc.replace(".", "_")
-    page_folder = normalize_url(url)
-    meta_dir = Path(base_dir) / "Data" / date / domain_folder / "metadata"
-    meta_dir.mkdir(parents=True, exist_ok=True)
-    file_path = meta_dir / f"{page_folder}.json"
-    file_path.write_text(json.dumps(meta, indent=2), encoding="utf-8") 
+    page = page or PagePath(url, base_dir)
+    page.file("metadata").write_text(json.dumps(meta, indent=2), encoding="utf-8")
 
 
-def pdf_data(url,base_dir,pdf):
+def pdf_data(url,base_dir,pdf,page=None):
     if not pdf:
         return
-    date = datetime.now().strftime("%Y-%m-%d")
-    parsed = urlparse(url)
-    domain_folder = parsed.netloc.replace(".", "_")
-    page_folder = normalize_url(url)
-    pdf_dir = Path(base_dir) / "Data" / date / domain_folder / "PDF"
-    pdf_dir.mkdir(parents=True, exist_ok=True)
-    file_path = pdf_dir / f"{page_folder}.pdf"
-    file_path.write_bytes(pdf)
+    page = page or PagePath(url, base_dir)
+    page.file("pdf").write_bytes(pdf)
 
 
-def json_data(url,base_dir,json_str):
+def json_data(url,base_dir,json_str,page=None):
     if not json_str:
         return
-    date = datetime.now().strftime("%Y-%m-%d")
-    parsed = urlparse(url)
-    domain_folder = parsed.netloc.replace(".", "_")
-    page_folder = normalize_url(url)
-    json_dir = Path(base_dir) / "Data" / date / domain_folder / "JSON"
-    json_dir.mkdir(parents=True, exist_ok=True)
-    file_path = json_dir / f"{page_folder}.json"
-    file_path.write_text(json.dumps(json_str, ensure_ascii=False, indent=2), encoding="utf-8")
+    page = page or PagePath(url, base_dir)
+    page.file("json").write_text(json.dumps(json_str, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+_duplicates_lock = threading.Lock()
+
 
+def duplicate_link(url, base_dir, original, match, distance=0, page=None):
+    # a page skipped as a copy of an earlier one -> one line in Data/<date>/<domain>/duplicates.jsonl
+    page = page or PagePath(url, base_dir)
+    line = json.dumps({"url": url, "duplicate_of": original, "match": match, "distance": distance}, ensure_ascii=False)
+    with _duplicates_lock:
+        with open(_cached_dir(page.root) / "duplicates.jsonl", "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def result_dump(result, html=True):
+    # json artifact of a crawl result, binary captures left out (and the html copies for text-only runs)
+    exclude = {'pdf', 'screenshot'}
+    if not html:
+        exclude |= {'html', 'cleaned_html', 'fit_html'}
+    return result.model_dump(exclude=exclude)
+
+
+def save_crawl_result(result, base_dir, pdf=True, screenshot=True, html=True):
+    # every artifact of one crawl4ai result, the page path is resolved once for all of them
+    # (blocking, ArtifactSink runs this on background writer threads)
+    # pdf / screenshot / html -> what the capture profile keeps (capture.py)
+    url = result.url
+    page = PagePath(url, base_dir)
+    if html:
+        html_default(url, base_dir, result.cleaned_html, page)
+    markdown_collection(url, base_dir, result.markdown, page)
+    if pdf:
+        pdf_data(url, base_dir, result.pdf, page)
+    metadata_data(url, base_dir, result.metadata, page)
+    json_data(url, base_dir, result_dump(result, html), page)
+    if screenshot:
+        screenshot_data(url, base_dir, result.screenshot, page)
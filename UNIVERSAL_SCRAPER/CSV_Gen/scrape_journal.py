@@ -0,0 +1,119 @@
+# durable per-run journal for listing / sitemap scrapes
+# a restarted run skips urls already in the csv and only retries the failed ones
+"""
+folder structure
+
+base_dir
+    journal
+        domain
+            sitemap_<hash of sitemap url>.sqlite
+            listing_<hash of listing url>.sqlite
+
+urls table -> url, status (running / done / failed), attempts, last_error, updated_at
+              url is the canonical form (url_canon), other spellings of a finished url are skipped too
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from pathlib import Path
+
+from CSV_Gen.url_canon import canonical_url
+from CSV_Gen.settings import JOURNAL_MAX_ATTEMPTS
+logger = logging.getLogger("selector_discovery")
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def journal_path(base_dir, domain, kind, source):
+    digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+    return Path(base_dir) / "journal" / domain / f"{kind}_{digest}.sqlite"
+
+
+class ScrapeJournal:
+    """
+    journal = ScrapeJournal(path)
+    journal.should_scrape(url)      -> False for done urls and urls out of attempts
+    journal.started(url) / done(url) / failed(url, error)
+    journal.commit()                -> call after the rows of the done urls are flushed to the csv
+
+    nothing is committed on its own, so a url is never "done" on disk before its row is.
+    """
+
+    def __init__(self, path, max_attempts=JOURNAL_MAX_ATTEMPTS, resume=True):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not resume and self.path.exists():
+            os.remove(self.path)
+        self.max_attempts = max_attempts
+
+        self.db = sqlite3.connect(self.path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.db.commit()
+
+        # earlier state is read once, lookups during the run stay in memory
+        self._previous = {
+            url: (status, attempts)
+            for url, status, attempts in self.db.execute("SELECT url, status, attempts FROM urls")
+        }
+        done = sum(1 for status, _ in self._previous.values() if status == DONE)
+        failed = sum(1 for status, _ in self._previous.values() if status == FAILED)
+        self.resumed = bool(self._previous)
+        if self.resumed:
+            logger.info(f"Resuming run: {done} done, {failed} failed in {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def should_scrape(self, url):
+        status, attempts = self._previous.get(canonical_url(url), (None, 0))
+        if status == DONE:
+            return False
+        if status in (FAILED, RUNNING) and attempts >= self.max_attempts:
+            return False
+        return True
+
+    def started(self, url):
+        self.db.execute("""
+            INSERT INTO urls (url, status, attempts, updated_at) VALUES (?, ?, 1, ?)
+            ON CONFLICT(url) DO UPDATE SET status = excluded.status, attempts = attempts + 1,
+                                           updated_at = excluded.updated_at
+        """, (canonical_url(url), RUNNING, time.time()))
+
+    def done(self, url):
+        self.db.execute(
+            "UPDATE urls SET status = ?, last_error = NULL, updated_at = ? WHERE url = ?",
+            (DONE, time.time(), canonical_url(url))
+        )
+
+    def failed(self, url, error):
+        self.db.execute(
+            "UPDATE urls SET status = ?, last_error = ?, updated_at = ? WHERE url = ?",
+            (FAILED, str(error)[:500], time.time(), canonical_url(url))
+        )
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM urls GROUP BY status").fetchall())
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
@@ -12,16 +12,169 @@ import datetime
 from zoneinfo import ZoneInfo
 import os
 import logging
+from contextlib import nullcontext
+
+from CSV_Gen.browser_pool import BrowserPool
+from CSV_Gen.save_data import html_collection
+from CSV_Gen.page_cache import PageCache
+from CSV_Gen.pipeline import scrape_ordered
+from CSV_Gen.sitemap_reader import aiter_sitemap_urls
+from CSV_Gen.extraction import compile_selectors
+from CSV_Gen.parse_pool import ParsePool
+from CSV_Gen.rate_limit import RateLimiter
+from CSV_Gen.http_client import HttpClient
+from CSV_Gen.tiered_fetch import TieredFetcher
+from CSV_Gen.row_writer import CsvRowWriter, FanoutWriter, product_fieldnames
+from CSV_Gen.columnar_writer import ParquetRowWriter, parquet_available
+from CSV_Gen.scrape_journal import ScrapeJournal, journal_path
+from CSV_Gen.url_clusters import ClusterMap, PRODUCT
+from CSV_Gen.url_canon import UrlSeen, unique_urls as dedupe_urls
+from CSV_Gen.content_dedupe import DuplicateIndex
+from CSV_Gen.settings import (
+    BROWSER_POOL_SIZE, BROWSER_RECYCLE_AFTER, SCRAPE_CONCURRENCY, SCRAPE_PER_HOST, PARSER_BACKEND,
+    TIERED_FETCH, LISTING_MAX_PAGES, LISTING_MAX_PRODUCTS, PARQUET_OUTPUT, SITEMAP_UNMATCHED, PARSE_WORKERS,
+    RATE_LIMIT_ENABLED, DEDUPE_MODE, CSV_BATCH_SIZE, PARQUET_ROW_GROUP, PAGE_CACHE_ENABLED
+)
 logger = logging.getLogger("selector_discovery")
 
 
-# STEP 1: Load listing inputs
-
-def listing_scraper(html_content,listing_selectors,base_dir,product_selector_path):
-    html = html_content
-
-    # STEP 2: Extract product URLs
-
+# Product scraper (shared by listing and sitemap scraping)
+
+def open_row_writers(csv_path, product_selectors, journal, parquet=PARQUET_OUTPUT, append=False):
+    # products.csv (+ parts in a products.parquet/ folder next to it). the csv is flushed every
+    # CSV_BATCH_SIZE rows and the journal commits right after, parquet writes a part every PARQUET_ROW_GROUP
+    # rows on its own and takes the committed rows it never wrote back from the csv when the run is resumed
+    # append -> keep the rows already there (resumed journal, or an earlier scrape of the same session)
+    append = append or journal.resumed
+    fieldnames = product_fieldnames(product_selectors)
+    if parquet and not parquet_available():
+        logger.error("pyarrow not installed, skipping parquet output")
+        parquet = False
+    writers = [CsvRowWriter(csv_path, fieldnames, batch_size=CSV_BATCH_SIZE, append=append)]
+    if parquet:
+        columnar = ParquetRowWriter(Path(csv_path).with_suffix(".parquet"), fieldnames, row_group=PARQUET_ROW_GROUP,
+                                    append=append)
+        columnar.backfill(csv_path)
+        writers.append(columnar)
+    return FanoutWriter(writers, batch_size=CSV_BATCH_SIZE, on_flush=journal.commit)
+
+
+DUPLICATE_FIELDS = ["url", "duplicate_of", "match", "distance"]
+
+
+def open_duplicate_log(csv_path, journal, mode=DEDUPE_MODE, append=False):
+    # duplicates.csv next to products.csv: which url was skipped as a copy of which (link mode only)
+    if mode != "link":
+        return nullcontext()
+    return CsvRowWriter(Path(csv_path).with_name("duplicates.csv"), DUPLICATE_FIELDS,
+                        append=append or journal.resumed)
+
+
+def print_duplicates(duplicates):
+    if duplicates is not None and duplicates.duplicates:
+        print(f"Skipped {sum(duplicates.duplicates.values())} duplicate pages ({dict(duplicates.duplicates)})")
+
+
+def scrape_product(html, selectors, backend=PARSER_BACKEND):
+    # one-off extraction, runs over many pages should compile_selectors once instead
+    return compile_selectors(selectors, backend).extract(html)
+
+
+async def scrape_urls(urls, product_selectors, base_dir, label, writer, journal,
+                      pool_size=BROWSER_POOL_SIZE, recycle_after=BROWSER_RECYCLE_AFTER,
+                      concurrency=SCRAPE_CONCURRENCY, per_host=SCRAPE_PER_HOST,
+                      parser_backend=PARSER_BACKEND, tiered=TIERED_FETCH, parse_workers=PARSE_WORKERS,
+                      duplicates=None, duplicate_log=None):
+    # fetch + extract many urls at once on one browser, rows are streamed to writer in input order
+    # journal records every url, urls finished by an earlier run of the same source are skipped
+    # duplicates (DuplicateIndex): exact copies of a page already seen are not extracted, only logged,
+    # near matches are logged and still extracted
+    # urls: list, (async) iterable, or urls(pool, cache) -> async iterable for sources that render pages themselves
+    # parsing runs in parse_workers processes, the event loop only fetches
+    fetcher = None
+
+    async def extract(url, html):
+        row = fetcher.take_row(url) if fetcher else None
+        if duplicates is not None:
+            found = duplicates.check(url, await extractor.fingerprint(html))
+            if found is not None:
+                original, match, distance = found
+                logger.info(f"Duplicate ({match}) of {original}: {url}")
+                if duplicate_log is not None:
+                    duplicate_log.write({"url": url, "duplicate_of": original, "match": match, "distance": distance})
+                if match == "exact":
+                    journal.done(url)
+                    return None
+        if row is None:
+            row = await extractor.extract(html)
+        row["url"] = url
+        return row
+
+    def emit(idx, url, row):
+        writer.write(row)
+        journal.done(url)
+
+    async def pending_urls(source):
+        skipped = 0
+        if hasattr(source, "__aiter__"):
+            async for url in source:
+                if journal.should_scrape(url):
+                    yield url
+                else:
+                    skipped += 1
+        else:
+            for url in source:
+                if journal.should_scrape(url):
+                    yield url
+                else:
+                    skipped += 1
+        if skipped:
+            print(f"Skipped {skipped} URLs already finished by an earlier run")
+
+    extractor = ParsePool(product_selectors, parser_backend, parse_workers)
+    logger.info(f"Extracting {len(extractor.fields)} fields with {extractor.backend} ({extractor.workers} parse workers)")
+
+    # one limiter for http and browser fetches, both hit the same hosts
+    limiter = RateLimiter(per_host) if RATE_LIMIT_ENABLED else None
+
+    async with extractor, HttpClient(limiter=limiter) as client, \
+            BrowserPool(pool_size, recycle_after, limiter=limiter) as pool:
+        # the page cache revalidates through the same client (and limiter), not opened when disabled
+        with PageCache(base_dir, client=client) if PAGE_CACHE_ENABLED else nullcontext() as cache:
+            if tiered:
+                fetcher = TieredFetcher(base_dir, client, pool, extractor, cache)
+
+            source = urls(pool, cache) if callable(urls) else urls
+            # streamed url sources have no length up front
+            total = len(source) if hasattr(source, "__len__") else "?"
+
+            async def fetch(idx, url):
+                print(f"{label} {idx + 1}/{total}")
+                journal.started(url)
+                try:
+                    if fetcher:
+                        html = await fetcher.fetch(url)
+                    else:
+                        # product rows are extracted from the raw render, no clean copy needed
+                        html = await html_collection(url, base_dir, pool, save_clean=False, cache=cache)
+                except Exception as e:
+                    journal.failed(url, e)
+                    raise
+                if not html:
+                    journal.failed(url, "no html")
+                return html
+
+            try:
+                return await scrape_ordered(pending_urls(source), fetch, extract, emit, concurrency, per_host)
+            finally:
+                if fetcher:
+                    fetcher.save()
+                if limiter is not None and limiter.hosts:
+                    print(f"Host rates:\n{limiter.summary()}")
+
+
+def listing_page_links(html, listing_selectors, page_url=None):
+    """product urls of one listing page + absolute url of the next page (None when there is none)"""
     soup = BeautifulSoup(html, "html.parser")
 
     cards = soup.select(listing_selectors["product_card"])
@@ -31,12 +184,47 @@ def listing_scraper(html_content,listing_selectors,base_dir,product_selector_pat
         link = card.select_one(listing_selectors["product_link"])
         if link and link.get("href"):
             product_urls.append(link["href"])
-    base_url = soup.base["href"] if soup.base else ""
+    base_url = urljoin(page_url or "", soup.base["href"]) if soup.base and soup.base.get("href") else page_url
     product_urls = [urljoin(base_url or "", u) for u in product_urls]
-    # dedupe
-    unique_urls = list(dict.fromkeys(product_urls))
 
-    print(f"\nFound {len(unique_urls)} product URLs")
+    next_url = None
+    if listing_selectors.get("pagination") and page_url:
+        try:
+            nxt = soup.select_one(listing_selectors["pagination"])
+        except Exception as e:
+            logger.error(f"Invalid pagination selector: {e}")
+            nxt = None
+        # selector may point at the <a> itself or at a wrapper around it
+        if nxt is not None and not nxt.get("href"):
+            nxt = nxt.find("a", href=True)
+        if nxt is not None and nxt.get("href") and not nxt["href"].startswith(("#", "javascript:")):
+            next_url = urljoin(base_url or "", nxt["href"])
+
+    return product_urls, next_url
+
+
+# STEP 1: Load listing inputs
+
+def listing_scraper(html_content,listing_selectors,base_dir,product_selector_path,listing_url=None,resume=True,
+                    max_pages=LISTING_MAX_PAGES,max_products=LISTING_MAX_PRODUCTS,
+                    pool_size=BROWSER_POOL_SIZE,recycle_after=BROWSER_RECYCLE_AFTER,
+                    concurrency=SCRAPE_CONCURRENCY,per_host=SCRAPE_PER_HOST,
+                    parser_backend=PARSER_BACKEND,tiered=TIERED_FETCH,parse_workers=PARSE_WORKERS,
+                    dedupe=DEDUPE_MODE,append=False):
+    # append=True keeps the rows an earlier scrape of this session wrote to products.csv
+    # returns the number of rows saved
+    html = html_content
+
+    # STEP 2: Extract product URLs (first page now, next pages are followed while scraping)
+
+    first_urls, next_url = listing_page_links(html, listing_selectors, listing_url)
+    # dedupe on the canonical url (tracking params, fragments, trailing slashes...), the listed url is fetched
+    seen_products = UrlSeen()
+    unique_urls = dedupe_urls(first_urls, seen_products)
+    if max_products:
+        unique_urls = unique_urls[:max_products]
+
+    print(f"\nFound {len(unique_urls)} product URLs on the first listing page")
 
     # STEP 3: Load product selectors
 
@@ -55,20 +243,6 @@ def listing_scraper(html_content,listing_selectors,base_dir,product_selector_pat
 
     # STEP 4: Product scraper
 
-    def scrape_product(html, selectors):
-        soup = BeautifulSoup(html, "html.parser")
-        data = {}
-
-        for field, selector in selectors.items():
-            if not selector:
-                data[field] = ""
-                continue
-
-            el = soup.select_one(selector)
-            data[field] = el.get_text(strip=True) if el else ""
-
-        return data
-
     headers = {
         "User-Agent": (
             "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
@@ -78,103 +252,94 @@ def listing_scraper(html_content,listing_selectors,base_dir,product_selector_pat
         "Accept-Language": "en-US,en;q=0.9"
     }
 
-    all_products = []
-
-    for idx, url in enumerate(unique_urls, start=1):
-        print(f"Scraping product {idx}/{len(unique_urls)}")
-
-        product_html = asyncio.run(html_collection(url, base_dir))
-        if not product_html:
-            continue
-
-        product_data = scrape_product(product_html, product_selectors)
-        product_data["url"] = url
-
-        all_products.append(product_data)
+    if not unique_urls:
+        print("No products scraped. CSV not created.")
+        return 0
 
-    # STEP 5: Save CSV
+    # STEP 5: Save CSV (rows are streamed in while scraping)
     domain = urlparse(unique_urls[0]).hostname or "unknown"
-    csv_dir = Path(base_dir) / "CSV" / domain
-    csv_dir.mkdir(parents=True, exist_ok=True)
-
-    if not all_products:
+    csv_path = Path(base_dir) / "CSV" / domain / "products.csv"
+
+    async def product_urls(pool, cache):
+        # next listing page is fetched in the background while this page's products are scraped
+        seen_pages = UrlSeen([listing_url] if listing_url else [])
+        taken = len(unique_urls)
+        page_urls, page_next = unique_urls, next_url
+        page_no = 1
+
+        def start_next(url):
+            if not url or url in seen_pages or page_no >= max_pages:
+                return None
+            if max_products and taken >= max_products:
+                return None
+            seen_pages.add(url)
+            return asyncio.create_task(html_collection(url, base_dir, pool, cache=cache))
+
+        prefetch = None
+        try:
+            while True:
+                prefetch = start_next(page_next)
+                for url in page_urls:
+                    yield url
+                if prefetch is None:
+                    return
+
+                next_page_url = page_next
+                next_html = await prefetch
+                prefetch = None
+                page_no += 1
+                if not next_html:
+                    print(f"Listing page {page_no} failed, stopping pagination: {next_page_url}")
+                    return
+
+                # off the event loop, product pages keep fetching meanwhile
+                found, page_next = await asyncio.to_thread(listing_page_links, next_html, listing_selectors, next_page_url)
+                page_urls = []
+                for url in found:
+                    if max_products and taken >= max_products:
+                        break
+                    if not seen_products.add(url):
+                        continue
+                    page_urls.append(url)
+                    taken += 1
+                print(f"Listing page {page_no}: {len(page_urls)} new product URLs")
+                if not page_urls:
+                    return
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+
+    # same listing again -> same journal, finished products are skipped and the csv is appended to
+    source = listing_url or "\n".join(unique_urls)
+    duplicates = DuplicateIndex() if dedupe != "off" else None
+    with ScrapeJournal(journal_path(base_dir, domain, "listing", source), resume=resume) as journal:
+        with open_row_writers(csv_path, product_selectors, journal, append=append) as writer, \
+                open_duplicate_log(csv_path, journal, dedupe, append) as duplicate_log:
+            saved = asyncio.run(scrape_urls(
+                product_urls, product_selectors, base_dir, "Scraping product", writer, journal,
+                pool_size, recycle_after, concurrency, per_host, parser_backend, tiered, parse_workers,
+                duplicates, duplicate_log
+            ))
+        counts = journal.counts()
+    print_duplicates(duplicates)
+
+    if not saved and not counts.get("done"):
         print("No products scraped. CSV not created.")
-        return
-    csv_path = csv_dir / "products.csv"
-
-    with csv_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=all_products[0].keys()
-        )
-        writer.writeheader()
-        writer.writerows(all_products)
+        return 0
 
-    print(f"\nSaved {len(all_products)} products to {csv_path}")
+    print(f"\nSaved {saved} products to {csv_path} ({counts.get('done', 0)} done, {counts.get('failed', 0)} failed in total)")
+    return saved
 def ensure_dir(path):
     """Create directory if it doesn't exist"""
     os.makedirs(path, exist_ok=True)
 
 
-async def html_collection(url,base_dir='/data/web'):
-    try:
-        today = datetime.datetime.now(ZoneInfo("Asia/Kolkata")).date().isoformat()
-        domain = urlparse(url).hostname or "unknown"
-        raw_dir = os.path.join(base_dir, "raw", today, domain, "html")
-        ensure_dir(raw_dir)
-        path = urlparse(url).path.strip("/")
-        slug = path.replace("/", "_") if path else "root"
-        html_path = os.path.join(raw_dir, f"{slug}.html")
-
-        browser_cfg = BrowserConfig(headless=True)
-        run_cfg = CrawlerRunConfig(
-            cache_mode=CacheMode.BYPASS,
-            scan_full_page=True,
-            scroll_delay=0.5,
-            remove_overlay_elements=True
-        )
-
-        async with AsyncWebCrawler(config=browser_cfg) as crawler:
-            result = await crawler.arun(url, config=run_cfg)
-
-        if not result or not result.html:
-            logger.error(f"Failed to fetch HTML: {url}")
-            return None
-
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(result.html)
-
-        logger.info(f"HTML saved at: {html_path}")
-        return result.html
-
-    except Exception as e:
-        logger.error(f"html_collection error for {url}: {e}")
-        return None
-
-
-
-def sitemap_scraper(sitemap_url,product_selector_path,base_dir):
-    resp = requests.get(sitemap_url, headers={
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/120.0.0.0 Safari/537.36"
-        ),
-        "Accept": "application/xml,text/xml;q=0.9,*/*;q=0.8",
-    },
-timeout=20)
-    resp.raise_for_status()
-
-    root = ET.fromstring(resp.text)
-    ns = {"ns": "http://www.sitemaps.org/schemas/sitemap/0.9"}
-
-    urls = []
-
-    for url in root.findall("ns:url", ns):
-        loc = url.find("ns:loc", ns)
-        if loc is not None and loc.text:
-            urls.append(loc.text.strip())
-
+def sitemap_scraper(sitemap_url,product_selector_path,base_dir,resume=True,
+                    pool_size=BROWSER_POOL_SIZE,recycle_after=BROWSER_RECYCLE_AFTER,
+                    concurrency=SCRAPE_CONCURRENCY,per_host=SCRAPE_PER_HOST,
+                    parser_backend=PARSER_BACKEND,tiered=TIERED_FETCH,unmatched=SITEMAP_UNMATCHED,
+                    parse_workers=PARSE_WORKERS,dedupe=DEDUPE_MODE,append=False):
+    # append=True keeps the rows an earlier scrape of this session (listing clusters) wrote to products.csv
     product_selector_path = Path(product_selector_path)
     if not product_selector_path.exists():
         raise FileNotFoundError("Product selector JSON not found")
@@ -193,53 +358,90 @@ timeout=20)
         "Accept-Language": "en-US,en;q=0.9"
     }
 
-    all_rows = []
-
-    for idx, url in enumerate(urls, start=1):
-        print(f"Sitemap scraping {idx}/{len(urls)}")
-
-        try:
-            html = asyncio.run(html_collection(url, base_dir))
-            if not html:
-                continue
-        except Exception:
-            continue
-
-        soup = BeautifulSoup(html, "html.parser")
-        row = {}
-
-        for field, selector in product_selectors.items():
-            if not selector:
-                row[field] = ""
+    domain = urlparse(sitemap_url).hostname or "unknown"
+    csv_path = Path(base_dir) / "CSV" / domain / "products.csv"
+
+    # labelled url clusters (CSV_Main.sitemap): only product clusters are rendered, each with its own
+    # selectors when it has them. one pass per distinct selector set, usually a single one.
+    clusters = ClusterMap(base_dir, domain)
+    default_key = json.dumps(product_selectors, sort_keys=True)
+    passes = {}
+    if clusters:
+        for cluster in clusters.clusters.values():
+            if cluster["kind"] == PRODUCT:
+                selectors = cluster.get("selectors") or product_selectors
+                passes.setdefault(json.dumps(selectors, sort_keys=True), selectors)
+        if unmatched == "scrape":
+            passes.setdefault(default_key, product_selectors)
+        print(f"Routing sitemap URLs by {len(clusters.clusters)} clusters ({dict(clusters.kinds())})")
+        if not passes:
+            print("No product clusters labelled for this sitemap, nothing to scrape.")
+            return
+    else:
+        passes[default_key] = product_selectors
+
+    def route(url):
+        # (selector key of the pass this url belongs to, None for non-product urls, kind of the url)
+        if not clusters:
+            return default_key, PRODUCT
+        cluster = clusters.match(url)
+        if cluster is None:
+            if unmatched == "scrape":
+                return default_key, PRODUCT
+            return None, "unmatched"
+        if cluster["kind"] != PRODUCT:
+            return None, cluster["kind"]
+        return json.dumps(cluster.get("selectors") or product_selectors, sort_keys=True), PRODUCT
+
+    found = 0
+    repeated = 0
+    skipped = {}
+
+    # urls are streamed from the sitemap (index children + .gz included) while scraping runs,
+    # a url listed twice (or in two spellings) is scraped once
+    async def sitemap_urls(key, first_pass):
+        nonlocal found, repeated
+        seen = UrlSeen()
+        async for url in aiter_sitemap_urls(sitemap_url):
+            if not seen.add(url):
+                if first_pass:
+                    repeated += 1
                 continue
-
-            el = soup.select_one(selector)
-            row[field] = el.get_text(strip=True) if el else ""
-
-        row["url"] = url
-        all_rows.append(row)
-
-    if not all_rows:
-        print("No URLs scraped. CSV not created.")
-        return
-    
-    if not urls:
+            url_key, kind = route(url)
+            if first_pass:
+                found += 1
+                if url_key is None:
+                    skipped[kind] = skipped.get(kind, 0) + 1
+            if url_key == key:
+                yield url
+
+    # same sitemap again -> same journal, finished urls are skipped and the csv is appended to
+    saved = 0
+    # one index across passes, a page is a duplicate whatever cluster it was routed to
+    duplicates = DuplicateIndex() if dedupe != "off" else None
+    with ScrapeJournal(journal_path(base_dir, domain, "sitemap", sitemap_url), resume=resume) as journal:
+        with open_row_writers(csv_path, product_selectors, journal, append=append) as writer, \
+                open_duplicate_log(csv_path, journal, dedupe, append) as duplicate_log:
+            for number, (key, selectors) in enumerate(passes.items()):
+                saved += asyncio.run(scrape_urls(
+                    sitemap_urls(key, number == 0), selectors, base_dir, "Sitemap scraping", writer, journal,
+                    pool_size, recycle_after, concurrency, per_host, parser_backend, tiered, parse_workers,
+                    duplicates, duplicate_log
+                ))
+        counts = journal.counts()
+    print_duplicates(duplicates)
+
+    if not found:
         print("No URLs found in sitemap.")
         return
 
-    domain = urlparse(urls[0]).hostname or "unknown"
-    csv_dir = Path(base_dir) / "CSV" / domain
-    csv_dir.mkdir(parents=True, exist_ok=True)
+    if repeated:
+        print(f"Skipped {repeated} sitemap URLs listed more than once")
+    if skipped:
+        print(f"Skipped non-product sitemap URLs: {skipped}")
 
-    csv_path = csv_dir / "products.csv"
-
-    with csv_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=all_rows[0].keys()
-        )
-        writer.writeheader()
-        writer.writerows(all_rows)
-
-    print(f"\nSaved {len(all_rows)} rows to {csv_path}")
+    if not saved and not counts.get("done"):
+        print("No URLs scraped. CSV not created.")
+        return
 
+    print(f"\nSaved {saved} rows to {csv_path} ({counts.get('done', 0)} done, {counts.get('failed', 0)} failed in total)")
@@ -0,0 +1,152 @@
+# batch validation of llm selectors against the page they were generated for
+# the page is parsed once, every candidate is counted once (memoized across fields)
+"""
+candidates of a selector (in order of preference when counts tie):
+    the selector as given
+    every comma alternative on its own ("h1.title, .product-name" -> "h1.title", ".product-name")
+    every leftmost-trimmed scope of those (".main .info h1" -> ".info h1" -> "h1")
+
+best candidate:
+    single-value field -> first candidate matching exactly once, else first candidate matching at all
+    expect_many field  -> first candidate matching at all (product cards...)
+
+counting runs as one xpath count() per candidate on an lxml tree (cssselect), selectors cssselect can't
+translate are counted with soupsieve on a BeautifulSoup tree built only when needed.
+"""
+import re
+import logging
+from bs4 import BeautifulSoup
+import soupsieve
+
+logger = logging.getLogger("selector_discovery")
+
+try:
+    from lxml import etree, html as lxml_html
+    from cssselect import HTMLTranslator, SelectorError
+except ImportError:  # optional
+    lxml_html = None
+
+COMBINATORS = {">", "+", "~"}
+_XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+_OPEN = {"[": "]", "(": ")"}
+
+
+def _split_top(selector, separators):
+    """split on separators outside of quotes, [] and (), separators themselves are dropped"""
+    parts, current = [], []
+    depth, quote = [], None
+    for ch in selector:
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in "\"'":
+            quote = ch
+        elif ch in _OPEN:
+            depth.append(_OPEN[ch])
+        elif depth and ch == depth[-1]:
+            depth.pop()
+        elif not depth and ch in separators:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+
+def selector_candidates(selector):
+    if not isinstance(selector, str) or not selector.strip():
+        return []
+    selector = selector.strip()
+    candidates = [selector]
+    for alternative in _split_top(selector, ","):
+        tokens = _split_top(alternative, " \t\n")
+        for i, token in enumerate(tokens):
+            if token in COMBINATORS:
+                continue
+            candidate = " ".join(tokens[i:])
+            if candidate not in candidates:
+                candidates.append(candidate)
+    return candidates
+
+
+class SelectorValidator:
+    """
+    validator = SelectorValidator(html)          # or an existing BeautifulSoup
+    validator.count(".price")                    -> matches on the page (0 for invalid selectors)
+    validated, report = validator.validate(selectors, expect_many=("product_card",))
+        report -> {field: [(candidate, count), ...]}
+    """
+
+    def __init__(self, document):
+        self._doc = None
+        self._soup = None
+        self._html = None
+        self._counts = {}
+        if isinstance(document, BeautifulSoup):
+            self._soup = document
+        else:
+            self._html = document or ""
+            if lxml_html is not None and self._html.strip():
+                # lxml refuses str input with an xml encoding declaration (xhtml served as text/html)
+                try:
+                    self._doc = lxml_html.document_fromstring(_XML_DECLARATION.sub("", self._html, count=1))
+                except (etree.ParserError, ValueError) as e:
+                    # counted with soupsieve instead
+                    logger.error(f"lxml could not parse the page, validating with BeautifulSoup: {e}")
+                    self._doc = None
+
+    def _soup_tree(self):
+        if self._soup is None:
+            self._soup = BeautifulSoup(self._html, "html.parser")
+        return self._soup
+
+    def count(self, selector):
+        if selector in self._counts:
+            return self._counts[selector]
+        found = None
+        if self._doc is not None:
+            try:
+                xpath = HTMLTranslator().css_to_xpath(selector)
+                found = int(etree.XPath(f"count({xpath})")(self._doc))
+            except (SelectorError, etree.XPathError):
+                found = None
+        if found is None:
+            try:
+                found = len(soupsieve.select(selector, self._soup_tree()))
+            except Exception:
+                found = 0
+        self._counts[selector] = found
+        return found
+
+    def best(self, selector, expect_many=False):
+        """(chosen candidate or "", [(candidate, count), ...])"""
+        report = [(candidate, self.count(candidate)) for candidate in selector_candidates(selector)]
+        matching = [(candidate, found) for candidate, found in report if found]
+        if not matching:
+            return "", report
+        if not expect_many:
+            for candidate, found in matching:
+                if found == 1:
+                    return candidate, report
+        return matching[0][0], report
+
+    def validate(self, selectors, expect_many=()):
+        validated, report = {}, {}
+        for field, selector in selectors.items():
+            if not isinstance(selector, str) or not selector:
+                validated[field] = selector
+                continue
+            validated[field], report[field] = self.best(selector, field in expect_many)
+            if not validated[field]:
+                logger.info(f"Selector for {field} matches nothing: {selector}")
+            elif field not in expect_many and self._counts[validated[field]] > 1:
+                logger.info(f"Selector for {field} matches {self._counts[validated[field]]} elements: {validated[field]}")
+        return validated, report
+
+
+def validate_selectors(document, selectors, expect_many=()):
+    """validated copy of selectors for an html string or BeautifulSoup, fields matching nothing become empty strings"""
+    return SelectorValidator(document).validate(selectors, expect_many)[0]
@@ -0,0 +1,105 @@
+# run settings shared by the csv scrapers
+# every value can be overridden with an env var so long runs can be tuned without code changes
+import os
+
+# shared headless browser (browser_pool.py)
+BROWSER_POOL_SIZE = int(os.getenv("SCRAPER_BROWSER_POOL_SIZE", "4"))          # pages rendering at the same time
+BROWSER_RECYCLE_AFTER = int(os.getenv("SCRAPER_BROWSER_RECYCLE_AFTER", "200"))  # restart chromium after N pages, 0 = never
+
+# concurrent product scraping (pipeline.py)
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "8"))   # urls in flight across all hosts
+SCRAPE_PER_HOST = int(os.getenv("SCRAPE_PER_HOST", "4"))         # urls in flight per host
+
+# local page cache (page_cache.py)
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", str(24 * 3600)))         # seconds a render is served without asking the site
+PAGE_CACHE_MAX_MB = int(os.getenv("PAGE_CACHE_MAX_MB", "2048"))           # LRU eviction above this size
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "1") not in ("0", "false", "no")
+
+# pooled async http client (http_client.py)
+HTTP_CONCURRENCY = int(os.getenv("HTTP_CONCURRENCY", "32"))   # open connections across all hosts
+HTTP_PER_HOST = int(os.getenv("HTTP_PER_HOST", "8"))          # open connections per host
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))            # extra attempts on network errors / 429 / 5xx
+HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", "20"))           # seconds per request
+
+# selector extraction (extraction.py): auto | selectolax | lxml | bs4
+PARSER_BACKEND = os.getenv("SCRAPER_PARSER_BACKEND", "auto")
+
+# tiered fetching (tiered_fetch.py): plain http first, browser only when required fields are empty
+TIERED_FETCH = os.getenv("TIERED_FETCH", "1") not in ("0", "false", "no")
+REQUIRED_FIELDS = [f.strip() for f in os.getenv("REQUIRED_FIELDS", "name,price").split(",") if f.strip()]
+TIER_PROBE_PAGES = int(os.getenv("TIER_PROBE_PAGES", "3"))   # http misses before a domain goes straight to the browser
+TIER_BROWSER_TTL = int(os.getenv("TIER_BROWSER_TTL", str(7 * 24 * 3600)))   # seconds a domain stays on the browser tier before http is probed again
+TIER_RECHECK_EVERY = int(os.getenv("TIER_RECHECK_EVERY", "200"))   # browser tier pages between single http probes, 0 = never
+
+# streamed csv output (row_writer.py)
+CSV_BATCH_SIZE = int(os.getenv("CSV_BATCH_SIZE", "50"))      # rows buffered before a write + flush
+CSV_FSYNC_EVERY = int(os.getenv("CSV_FSYNC_EVERY", "500"))   # rows between fsyncs, 0 = only on close
+
+# resumable runs (scrape_journal.py)
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "3"))   # a failing url is retried on restart until this many attempts
+
+# listing pagination (scraper_logic.listing_scraper)
+LISTING_MAX_PAGES = int(os.getenv("LISTING_MAX_PAGES", "50"))        # listing pages followed, 1 = first page only
+LISTING_MAX_PRODUCTS = int(os.getenv("LISTING_MAX_PRODUCTS", "0"))   # product urls taken from the listing, 0 = no limit
+
+# columnar output next to products.csv (columnar_writer.py), needs pyarrow
+PARQUET_OUTPUT = os.getenv("PARQUET_OUTPUT", "1") not in ("0", "false", "no")
+PARQUET_ROW_GROUP = int(os.getenv("PARQUET_ROW_GROUP", "5000"))   # rows per parquet part file, the csv keeps flushing every CSV_BATCH_SIZE
+
+# template reuse before asking the llm (page_fingerprint.py)
+TEMPLATE_MATCH_THRESHOLD = float(os.getenv("TEMPLATE_MATCH_THRESHOLD", "0.9"))   # estimated skeleton similarity to reuse selectors
+
+# html sent to the llm for selector generation (dom_minimizer.py)
+MINIMIZE_KEEP_REPEATS = int(os.getenv("MINIMIZE_KEEP_REPEATS", "3"))   # exemplars kept of a run of identical siblings
+MINIMIZE_TEXT_CHARS = int(os.getenv("MINIMIZE_TEXT_CHARS", "120"))     # text node length before it is cut
+
+# sitemap url clustering (url_clusters.py)
+CLUSTER_SAMPLES = int(os.getenv("CLUSTER_SAMPLES", "2"))                 # pages per cluster fetched over http for the dom check, 0 = path only
+CLUSTER_MERGE_LITERALS = int(os.getenv("CLUSTER_MERGE_LITERALS", "8"))   # distinct last segments under one prefix before they become {slug}
+SITEMAP_UNMATCHED = os.getenv("SITEMAP_UNMATCHED", "skip")              # urls of no labelled cluster: skip | scrape
+
+# parse stage of the scrapers (parse_pool.py)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))   # parser processes, 0 = parse inline
+PARSE_QUEUE = int(os.getenv("PARSE_QUEUE", "0"))   # pages parsing or waiting for a parser, 0 = 2 x PARSE_WORKERS
+
+# per-host politeness (rate_limit.py)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") not in ("0", "false", "no")
+RATE_START_LIMIT = int(os.getenv("RATE_START_LIMIT", "2"))                 # requests in flight per host at the start, grows up to SCRAPE_PER_HOST
+RATE_LATENCY_FACTOR = float(os.getenv("RATE_LATENCY_FACTOR", "2.0"))       # latency over this x the best seen counts as overload
+RATE_MAX_INTERVAL = float(os.getenv("RATE_MAX_INTERVAL", "30"))            # max seconds between request starts after 429/503
+ROBOTS_TTL = int(os.getenv("ROBOTS_TTL", str(24 * 3600)))                  # seconds a robots.txt is reused
+ROBOTS_MAX_DELAY = float(os.getenv("ROBOTS_MAX_DELAY", "30"))              # cap for absurd Crawl-delay values
+
+# deep crawls (Website_data/crawl.py), crawl4ai's own rate limiter runs with these
+CRAWL_MEAN_DELAY = float(os.getenv("CRAWL_MEAN_DELAY", "1.0"))   # min seconds between requests to the site (robots Crawl-delay wins when bigger)
+CRAWL_MAX_RANGE = float(os.getenv("CRAWL_MAX_RANGE", "1.0"))     # random extra delay on top
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))     # pages of one crawl batch in flight
+
+# multi-process crawl on a disk frontier (Website_data/frontier.py)
+FRONTIER_WORKERS = int(os.getenv("FRONTIER_WORKERS", str(min(4, os.cpu_count() or 1))))   # worker processes, one browser each
+FRONTIER_POOL_SIZE = int(os.getenv("FRONTIER_POOL_SIZE", "4"))              # pages rendering at once per worker
+FRONTIER_BATCH = int(os.getenv("FRONTIER_BATCH", "16"))                     # urls leased per round trip
+FRONTIER_LEASE_SECONDS = int(os.getenv("FRONTIER_LEASE_SECONDS", "600"))   # a dead worker's urls are handed out again after this
+FRONTIER_MAX_ATTEMPTS = int(os.getenv("FRONTIER_MAX_ATTEMPTS", "3"))
+
+# url canonicalization + dedupe (url_canon.py)
+URL_DROP_PARAMS = {p.strip().lower() for p in os.getenv("URL_DROP_PARAMS", "").split(",") if p.strip()}   # extra query params to drop, on top of the tracking list
+URL_LOWERCASE_PATH = os.getenv("URL_LOWERCASE_PATH", "0") not in ("0", "false", "no")                     # fold path case too (case-insensitive servers)
+
+# crawl artifacts written in the background (artifact_sink.py)
+ARTIFACT_QUEUE = int(os.getenv("ARTIFACT_QUEUE", "16"))       # crawl results waiting for disk, the crawl waits when it is full
+ARTIFACT_WRITERS = int(os.getenv("ARTIFACT_WRITERS", "2"))    # writer threads
+CRAWL_STORAGE = os.getenv("CRAWL_STORAGE", "files")           # files (Data/<date>/<domain>/...) | warc (warc_store.py)
+WARC_SEGMENT_MB = int(os.getenv("WARC_SEGMENT_MB", "1024"))   # a new .warc.gz segment starts above this size
+
+# duplicate pages by content (content_dedupe.py)
+DEDUPE_MODE = os.getenv("DEDUPE_MODE", "link")                     # link (skip exact copies + record which page they copy) | drop | off
+DEDUPE_MAX_DISTANCE = int(os.getenv("DEDUPE_MAX_DISTANCE", "0"))   # simhash bits for near-duplicates (opt-in, only recorded, page still processed), 0 = exact only
+DEDUPE_MIN_TOKENS = int(os.getenv("DEDUPE_MIN_TOKENS", "50"))      # pages with fewer words are only matched exactly
+
+# what crawls render and save per page (capture.py)
+CAPTURE_PROFILE = os.getenv("CAPTURE_PROFILE", "default")              # default | text | html | visual, default = each crawl mode's own options
+CAPTURE_VISUAL_PATTERN = os.getenv("CAPTURE_VISUAL_PATTERN", "")       # regex, only matching urls get screenshot + pdf, empty = all
+CAPTURE_VISUAL_SAMPLE = float(os.getenv("CAPTURE_VISUAL_SAMPLE", "1.0"))   # fraction of urls that get screenshot + pdf
+CAPTURE_IMAGE_FORMAT = os.getenv("CAPTURE_IMAGE_FORMAT", "png")        # png | webp | jpeg (re-encoded with Pillow)
+CAPTURE_IMAGE_QUALITY = int(os.getenv("CAPTURE_IMAGE_QUALITY", "80"))  # webp / jpeg quality
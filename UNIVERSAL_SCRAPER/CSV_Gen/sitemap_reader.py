@@ -0,0 +1,181 @@
+# incremental sitemap reader
+# streams the xml from the network (gzip decoded on the fly), yields <loc> urls as they are parsed
+# and recurses into sitemapindex children one at a time, so scraping starts on the first url.
+# gather_sitemap_urls is the discovery variant: all children fetched in parallel on the pooled HttpClient
+import asyncio
+import zlib
+import logging
+import requests
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger("selector_discovery")
+
+SITEMAP_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept": "application/xml,text/xml;q=0.9,*/*;q=0.8",
+}
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _local(tag):
+    # "{http://www.sitemaps.org/schemas/sitemap/0.9}loc" -> "loc"
+    return tag.rsplit("}", 1)[-1]
+
+
+class _EntryParser:
+    """incremental <loc> parser, feed() raw (maybe gzip) bytes and get back (kind, loc) entries"""
+
+    def __init__(self):
+        self.parser = ET.XMLPullParser(events=("start", "end"))
+        self.decomp = None
+        self.root = None
+        self.first = True
+
+    def feed(self, chunk):
+        if self.first:
+            self.first = False
+            # Content-Encoding: gzip is already undone by the http client, .xml.gz files are gzip in the body
+            if chunk[:2] == GZIP_MAGIC:
+                self.decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.decomp is not None:
+            chunk = self.decomp.decompress(chunk)
+        self.parser.feed(chunk)
+        return self._entries()
+
+    def close(self):
+        if self.decomp is not None:
+            self.parser.feed(self.decomp.flush())
+        self.parser.close()
+        return self._entries()
+
+    def _entries(self):
+        entries = []
+        for event, elem in self.parser.read_events():
+            if event == "start":
+                if self.root is None:
+                    self.root = elem
+                continue
+
+            kind = _local(elem.tag)
+            if kind not in ("url", "sitemap"):
+                continue
+            for child in elem:
+                if _local(child.tag) == "loc" and child.text and child.text.strip():
+                    entries.append((kind, child.text.strip()))
+                    break
+            # drop parsed entries so memory stays flat on 50k-url files
+            elem.clear()
+            self.root.clear()
+        return entries
+
+
+def parse_sitemap_entries(data):
+    """(kind, loc) entries of a sitemap already in memory, kind is "sitemap" (index child) or "url" """
+    parser = _EntryParser()
+    return parser.feed(data) + parser.close()
+
+
+def _iter_entries(sitemap_url, session, timeout):
+    """yields (kind, loc) while the file is downloading"""
+    with session.get(sitemap_url, headers=SITEMAP_HEADERS, timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+
+        parser = _EntryParser()
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            yield from parser.feed(chunk)
+        yield from parser.close()
+
+
+def iter_sitemap_urls(sitemap_url, session=None, timeout=20, max_depth=5, _seen=None, _depth=0):
+    """
+    Generator of page urls in a sitemap (urlset or sitemapindex, plain or .gz).
+
+    children of an index are read lazily one after another, a broken child is logged and skipped.
+    """
+    own_session = session is None
+    if own_session:
+        session = requests.Session()
+    seen = _seen if _seen is not None else set()
+    seen.add(sitemap_url)
+
+    try:
+        children = []
+        for kind, loc in _iter_entries(sitemap_url, session, timeout):
+            if kind == "url":
+                yield loc
+            elif loc not in seen:
+                # index files are small, children are opened after the index is closed
+                children.append(loc)
+
+        if children and _depth >= max_depth:
+            logger.error(f"Sitemap index too deep, skipping children of {sitemap_url}")
+            return
+
+        for child in children:
+            if child in seen:
+                continue
+            try:
+                yield from iter_sitemap_urls(child, session, timeout, max_depth, seen, _depth + 1)
+            except (requests.RequestException, ET.ParseError, zlib.error) as e:
+                logger.error(f"Child sitemap failed {child}: {e}")
+    finally:
+        if own_session:
+            session.close()
+
+
+async def aiter_sitemap_urls(sitemap_url, **kwargs):
+    """async version for the scraper pipeline, network reads happen off the event loop"""
+    urls = iter_sitemap_urls(sitemap_url, **kwargs)
+    done = object()
+    try:
+        while True:
+            url = await asyncio.to_thread(next, urls, done)
+            if url is done:
+                return
+            yield url
+    finally:
+        urls.close()
+
+
+async def gather_sitemap_urls(sitemap_url, client, max_depth=5):
+    """
+    Every page url of a sitemap, children of an index are fetched in parallel on the pooled HttpClient
+    (its connection limits bound the concurrency). Order follows the index order.
+    A failing root raises, a failing child is logged and skipped.
+    """
+    seen = {sitemap_url}
+
+    async def read(url, depth):
+        resp = await client.get(url, headers=SITEMAP_HEADERS)
+        if not resp.ok:
+            raise requests.HTTPError(f"{resp.status} for sitemap {url}")
+        entries = await asyncio.to_thread(parse_sitemap_entries, resp.body)
+
+        urls = []
+        children = []
+        for kind, loc in entries:
+            if kind == "url":
+                urls.append(loc)
+            elif loc not in seen:
+                seen.add(loc)
+                children.append(loc)
+
+        if children and depth >= max_depth:
+            logger.error(f"Sitemap index too deep, skipping children of {url}")
+            children = []
+
+        results = await asyncio.gather(*(read(child, depth + 1) for child in children), return_exceptions=True)
+        for child, result in zip(children, results):
+            if isinstance(result, Exception):
+                logger.error(f"Child sitemap failed {child}: {result}")
+                continue
+            urls.extend(result)
+        return urls
+
+    return await read(sitemap_url, 0)
@@ -0,0 +1,127 @@
+# tiered fetching for product pages
+# server rendered shops don't need chromium: try a pooled http GET first, render only when the
+# compiled product selectors come back empty on it. Which tier works is remembered per domain in
+# <base_dir>/selectors/<domain>/fetch_tier.json so later pages (and later runs) skip the losing tier.
+# the browser tier is not for good: every TIER_RECHECK_EVERY pages one goes over http first, and after
+# TIER_BROWSER_TTL the domain is probed from scratch (sites move to server rendering, blocks get lifted)
+import os
+import json
+import time
+import logging
+from urllib.parse import urlparse
+
+from CSV_Gen.save_data import html_collection, save_collected_html, ensure_dir
+from CSV_Gen.settings import REQUIRED_FIELDS, TIER_PROBE_PAGES, TIER_BROWSER_TTL, TIER_RECHECK_EVERY
+logger = logging.getLogger("selector_discovery")
+
+HTTP = "http"
+BROWSER = "browser"
+
+
+class TieredFetcher:
+    """
+    fetch(url) -> html from the cheapest tier that fills the required fields
+
+    client    -> shared HttpClient, pool / cache -> shared BrowserPool / PageCache for the browser tier
+    extractor -> ParsePool of the run, required fields are checked with it
+    rows extracted while checking the http tier are kept, take_row(url) hands them to the
+    extract stage so the page isn't parsed twice
+    """
+
+    def __init__(self, base_dir, client, pool, extractor, cache=None,
+                 required_fields=REQUIRED_FIELDS, probe_pages=TIER_PROBE_PAGES, browser_ttl=TIER_BROWSER_TTL,
+                 recheck_every=TIER_RECHECK_EVERY):
+        self.base_dir = base_dir
+        self.client = client
+        self.pool = pool
+        self.cache = cache
+        self.extractor = extractor
+        self.probe_pages = probe_pages
+        self.browser_ttl = browser_ttl
+        self.recheck_every = recheck_every
+
+        # only fields that actually have a selector can be required, blank ones never fill
+        filled = [f for f in extractor.fields if extractor.selectors.get(f)]
+        self.required = [f for f in required_fields if f in filled] or filled
+
+        self.domains = {}
+        self._rows = {}
+
+    def _state(self, domain):
+        if domain not in self.domains:
+            state = {"tier": None, "http_ok": 0, "http_miss": 0, "browser_since": None, "browser_pages": 0}
+            path = self._tier_path(domain)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        state.update(json.load(f))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Unreadable fetch tier file {path}: {e}")
+            self.domains[domain] = state
+        return self.domains[domain]
+
+    def _tier_path(self, domain):
+        return os.path.join(self.base_dir, "selectors", domain, "fetch_tier.json")
+
+    def save(self):
+        for domain, state in self.domains.items():
+            path = self._tier_path(domain)
+            ensure_dir(os.path.dirname(path))
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+
+    def take_row(self, url):
+        return self._rows.pop(url, None)
+
+    def _complete(self, row):
+        return all(row.get(field) for field in self.required)
+
+    async def fetch(self, url):
+        domain = urlparse(url).hostname or "unknown"
+        state = self._state(domain)
+
+        recheck = False
+        if state["tier"] == BROWSER:
+            state["browser_pages"] = state.get("browser_pages", 0) + 1
+            if time.time() - (state.get("browser_since") or 0) > self.browser_ttl:
+                logger.info(f"{domain}: browser tier expired, probing plain http again")
+                state.update(tier=None, http_ok=0, http_miss=0, browser_since=None, browser_pages=0)
+            elif self.recheck_every and state["browser_pages"] % self.recheck_every == 0:
+                recheck = True
+
+        if state["tier"] != BROWSER or recheck:
+            html = await self._http(url)
+            if html:
+                row = await self.extractor.extract(html)
+                if self._complete(row):
+                    if state["tier"] == BROWSER:
+                        logger.info(f"{domain}: plain http fills the fields again, leaving the browser")
+                        state.update(tier=None, http_ok=0, http_miss=0, browser_since=None, browser_pages=0)
+                    state["http_ok"] += 1
+                    if state["tier"] is None:
+                        state["tier"] = HTTP
+                        logger.info(f"{domain}: plain http is enough, skipping the browser")
+                    self._rows[url] = row
+                    save_collected_html(url, self.base_dir, html, "raw")
+                    return html
+
+        if state["tier"] != BROWSER:
+            state["http_miss"] += 1
+            # nothing ever worked over http, or it stopped working -> browser until it expires
+            never_worked = state["http_ok"] == 0 and state["http_miss"] >= self.probe_pages
+            stopped_working = state["tier"] == HTTP and state["http_miss"] > state["http_ok"] + self.probe_pages
+            if never_worked or stopped_working:
+                state.update(tier=BROWSER, browser_since=time.time(), browser_pages=0)
+                logger.info(f"{domain}: required fields need rendering, using the browser")
+
+        return await html_collection(url, self.base_dir, self.pool, save_clean=False, cache=self.cache)
+
+    async def _http(self, url):
+        try:
+            resp = await self.client.get(url)
+        except Exception as e:
+            logger.error(f"http tier failed for {url}: {e}")
+            return None
+        if not resp.ok or "html" not in resp.headers.get("Content-Type", "html").lower():
+            return None
+        return resp.text
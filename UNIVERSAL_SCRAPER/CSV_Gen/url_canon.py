@@ -0,0 +1,157 @@
+# url canonicalization + a compact seen-set shared by the sitemap, listing and crawl paths
+# the same page reached with tracking params, a fragment, a trailing slash or an upper case host
+# used to be rendered once per spelling
+# the canonical form is only a key (seen-sets, journals, cache), pages are fetched and reported under the
+# url the site gave, which is the one the server is known to answer
+"""
+canonical_url(url):
+    scheme + host lower case, default port dropped, fragment dropped
+    tracking params dropped (utm_*, gclid, fbclid, ... + URL_DROP_PARAMS), remaining params sorted
+    percent escapes upper case, escaped unreserved characters decoded ("%7E" -> "~")
+    "//" in the path collapsed, trailing slash dropped (except "/"), empty path -> "/"
+    path case is kept (paths are case sensitive on most servers), URL_LOWERCASE_PATH=1 folds it too
+
+UrlSeen():
+    seen = UrlSeen()
+    if seen.add(url):          -> True the first time a canonical url is added
+        ...
+    url in seen
+
+    stores a 64-bit blake2b fingerprint per url in an open addressing table (array of uint64,
+    linear probing, kept at most half full) -> about 16 bytes per url instead of ~150 for a set of str.
+    two different urls share a fingerprint with probability ~n^2 / 2^65 (1 in ~370k runs at 10M urls),
+    such a url would be treated as seen.
+"""
+import re
+import hashlib
+from array import array
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from CSV_Gen.settings import URL_DROP_PARAMS, URL_LOWERCASE_PATH
+
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "twclid", "ttclid", "igshid", "srsltid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "ref_", "spm", "scid", "jsessionid"
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_", "oly_")
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+_ESCAPE = re.compile(r"%[0-9a-fA-F]{2}")
+_UNRESERVED = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+_SLASHES = re.compile(r"/{2,}")
+
+
+def _tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name in URL_DROP_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _escapes(part):
+    def fix(match):
+        char = chr(int(match.group(0)[1:], 16))
+        return char if char in _UNRESERVED else match.group(0).upper()
+    return _ESCAPE.sub(fix, part)
+
+
+def canonical_url(url):
+    """canonical spelling of an absolute http(s) url, other strings come back stripped"""
+    url = (url or "").strip()
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.netloc:
+        return url
+
+    host = (parts.hostname or "").rstrip(".")
+    netloc = host
+    if parts.port is not None and str(parts.port) != DEFAULT_PORTS[scheme]:
+        netloc = f"{host}:{parts.port}"
+    if parts.username:
+        netloc = f"{parts.username}{':' + parts.password if parts.password else ''}@{netloc}"
+
+    path = _escapes(_SLASHES.sub("/", parts.path)) or "/"
+    if len(path) > 1 and path.endswith("/"):
+        path = path.rstrip("/") or "/"
+    if URL_LOWERCASE_PATH:
+        path = path.lower()
+
+    query = ""
+    if parts.query:
+        params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _tracking(k)]
+        query = urlencode(sorted(params))
+
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def url_fingerprint(url, canonical=True):
+    """64-bit fingerprint of a url (of its canonical spelling by default), never 0"""
+    if canonical:
+        url = canonical_url(url)
+    value = int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+    return value or 1
+
+
+class UrlSeen:
+
+    def __init__(self, urls=(), capacity=1024):
+        size = 16
+        while size < capacity * 2:
+            size *= 2
+        self._table = array("Q", bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+        for url in urls:
+            self.add(url)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, url):
+        return self._find(url_fingerprint(url))[1]
+
+    def _find(self, fp):
+        # (slot, found): the slot holding fp, or the empty slot where it goes
+        table, mask = self._table, self._mask
+        slot = fp & mask
+        while True:
+            value = table[slot]
+            if value == fp:
+                return slot, True
+            if value == 0:
+                return slot, False
+            slot = (slot + 1) & mask
+
+    def add(self, url, canonicalize=True):
+        """True when the url (canonical) was not seen before, canonicalize=False for urls already canonical"""
+        return self.add_fingerprint(url_fingerprint(url, canonicalize))
+
+    def add_fingerprint(self, fp):
+        slot, found = self._find(fp)
+        if found:
+            return False
+        self._table[slot] = fp
+        self._count += 1
+        if self._count * 2 > len(self._table):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self._table
+        self._table = array("Q", bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        for fp in old:
+            if fp:
+                self._table[self._find(fp)[0]] = fp
+
+    def memory_bytes(self):
+        return self._table.itemsize * len(self._table)
+
+
+def unique_urls(urls, seen=None):
+    """urls as given (stripped) in first-seen order, urls whose canonical form was seen before dropped"""
+    seen = UrlSeen() if seen is None else seen
+    unique = []
+    for url in urls:
+        url = (url or "").strip()
+        if seen.add(url):
+            unique.append(url)
+    return unique
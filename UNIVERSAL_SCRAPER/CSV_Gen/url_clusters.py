@@ -0,0 +1,224 @@
+# url clustering for sitemap runs
+# sitemaps mix product, category, blog and cms pages. urls are grouped by path pattern, each cluster is
+# labelled once (product / listing / skip) and the sitemap scraper only renders the product clusters.
+"""
+path pattern of a url (host and query ignored), one token per path segment:
+    digits only             -> {n}       /p/12345            -> /p/{n}
+    several words (- or _)  -> {slug}    /products/red-shirt -> /products/{slug}
+    other tokens with digits-> {id}      /item/A7X99K        -> /item/{id}
+    anything else           -> literal   /collections/shoes  -> /collections/shoes
+    file extensions are kept            /p/12345.html       -> /p/{n}.html
+
+a literal last segment with many different values under the same prefix (/products/shirt,
+/products/hat, ...) is merged into {slug} as well.
+
+optional refinement: a few pages per cluster are fetched over plain http (no browser) and fingerprinted,
+clusters with the same dom template end up in the same group, so a group is labelled once.
+
+labels are stored in <base_dir>/selectors/<domain>/clusters.json, product selectors made for a cluster
+group in <base_dir>/selectors/<domain>/clusters/product_<pattern>.json (the domain's product_selector.json
+is left to the product / listing flows)
+"""
+import os
+import re
+import json
+import hashlib
+import random
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlparse
+
+from CSV_Gen.page_fingerprint import fingerprint, similarity
+from CSV_Gen.settings import CLUSTER_MERGE_LITERALS, CLUSTER_SAMPLES, TEMPLATE_MATCH_THRESHOLD
+logger = logging.getLogger("selector_discovery")
+
+PRODUCT = "product"
+LISTING = "listing"
+SKIP = "skip"
+KINDS = (PRODUCT, LISTING, SKIP)
+
+MAX_EXAMPLES = 5
+_EXT = re.compile(r"^(.+?)(\.[a-zA-Z0-9]{1,5})$")
+_WORDS = re.compile(r"[-_+]")
+
+
+def _segment_token(segment):
+    match = _EXT.match(segment)
+    name, ext = (match.group(1), match.group(2).lower()) if match else (segment, "")
+    if name.isdigit():
+        token = "{n}"
+    elif len([w for w in _WORDS.split(name) if w]) > 1:
+        token = "{slug}"
+    elif any(ch.isdigit() for ch in name):
+        token = "{id}"
+    else:
+        token = name.lower()
+    return token + ext
+
+
+def _is_literal(token):
+    return not token.startswith("{")
+
+
+def path_tokens(url):
+    path = urlparse(url).path
+    return [_segment_token(segment) for segment in path.split("/") if segment]
+
+
+def _join(tokens):
+    return "/" + "/".join(tokens)
+
+
+def _slug_last(tokens):
+    # same extension handling as _segment_token: "shirt.html" -> "{slug}.html"
+    match = _EXT.match(tokens[-1])
+    ext = match.group(2) if match else ""
+    return tokens[:-1] + ["{slug}" + ext]
+
+
+def cluster_urls(urls, merge_literals=CLUSTER_MERGE_LITERALS):
+    """
+    clusters sorted by size -> [{"pattern", "count", "examples"}]
+    examples are a random sample of the cluster (the first urls of a sitemap are often all alike)
+    """
+    tokens_of = {}
+    last_values = defaultdict(set)
+    for url in urls:
+        tokens = path_tokens(url)
+        tokens_of[url] = tokens
+        if tokens and _is_literal(tokens[-1]):
+            last_values[tuple(tokens[:-1])].add(tokens[-1])
+
+    merged = {prefix for prefix, values in last_values.items() if len(values) > merge_literals}
+
+    members = defaultdict(list)
+    for url, tokens in tokens_of.items():
+        if tokens and _is_literal(tokens[-1]) and tuple(tokens[:-1]) in merged:
+            tokens = _slug_last(tokens)
+        members[_join(tokens)].append(url)
+
+    clusters = []
+    for pattern, group_urls in members.items():
+        clusters.append({
+            "pattern": pattern,
+            "count": len(group_urls),
+            "examples": random.sample(group_urls, min(MAX_EXAMPLES, len(group_urls)))
+        })
+    clusters.sort(key=lambda c: (-c["count"], c["pattern"]))
+    return clusters
+
+
+async def sample_clusters(clusters, client, samples=CLUSTER_SAMPLES, threshold=TEMPLATE_MATCH_THRESHOLD):
+    """
+    fetches up to `samples` example pages per cluster over http and groups clusters by dom template.
+    sets "group" (int) and "mixed" (samples of one cluster disagree) on every cluster, keeps the
+    first sample html in "sample_html" for the caller (not saved). Returns the groups, biggest first.
+    """
+    async def get(url):
+        try:
+            resp = await client.get(url)
+        except Exception as e:
+            logger.error(f"Cluster sample failed {url}: {e}")
+            return None
+        if not resp.ok or "html" not in resp.headers.get("Content-Type", "html").lower():
+            return None
+        return resp.text
+
+    todo = [(cluster, url) for cluster in clusters for url in cluster["examples"][:samples]]
+    pages = await asyncio.gather(*(get(url) for _, url in todo))
+
+    sampled = defaultdict(list)
+    for (cluster, url), html in zip(todo, pages):
+        if not html:
+            continue
+        try:
+            found = await asyncio.to_thread(fingerprint, html)
+        except Exception as e:
+            # one odd page doesn't stop the clustering, the cluster just has a sample less
+            logger.error(f"Cluster sample unusable {url}: {e}")
+            continue
+        sampled[cluster["pattern"]].append((url, html, found))
+
+    groups = []   # [{"minhash", "clusters"}]
+    for cluster in clusters:
+        pages = sampled.get(cluster["pattern"], [])
+        cluster["sample_html"] = pages[0][1] if pages else None
+        cluster["sample_url"] = pages[0][0] if pages else None
+        cluster["mixed"] = any(similarity(pages[0][2][1], fp[1]) < threshold for _, _, fp in pages[1:])
+
+        group = None
+        if pages:
+            minhash = pages[0][2][1]
+            for candidate in groups:
+                if candidate["minhash"] is not None and similarity(minhash, candidate["minhash"]) >= threshold:
+                    group = candidate
+                    break
+        if group is None:
+            group = {"minhash": pages[0][2][1] if pages else None, "clusters": []}
+            groups.append(group)
+        group["clusters"].append(cluster)
+
+    for number, group in enumerate(groups):
+        for cluster in group["clusters"]:
+            cluster["group"] = number
+    return [group["clusters"] for group in groups]
+
+
+def cluster_selector_path(base_dir, domain, pattern):
+    """product selector file of the cluster group whose first pattern is `pattern`"""
+    name = re.sub(r"[^a-zA-Z0-9]+", "_", pattern).strip("_")[:60] or "root"
+    digest = hashlib.sha1(pattern.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(base_dir, "selectors", domain, "clusters", f"product_{name}_{digest}.json")
+
+
+class ClusterMap:
+    """
+    clusters = ClusterMap(base_dir, domain)
+    clusters.label(cluster, "product", selectors)   -> selectors optional, product clusters only
+    clusters.save()
+    clusters.match(url)                             -> stored cluster dict or None
+    """
+
+    def __init__(self, base_dir, domain):
+        self.path = os.path.join(base_dir, "selectors", domain, "clusters.json")
+        self.clusters = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.clusters = json.load(f).get("clusters", {})
+            except (OSError, ValueError) as e:
+                logger.error(f"Unreadable cluster file {self.path}: {e}")
+
+    def __bool__(self):
+        return bool(self.clusters)
+
+    def label(self, cluster, kind, selectors=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown cluster kind {kind}")
+        self.clusters[cluster["pattern"]] = {
+            "kind": kind,
+            "count": cluster["count"],
+            "examples": cluster["examples"],
+            "group": cluster.get("group"),
+            "selectors": selectors if kind == PRODUCT else None
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "saved_at": datetime.now().isoformat(timespec="seconds"),
+                "clusters": self.clusters
+            }, f, indent=2, ensure_ascii=False)
+
+    def match(self, url):
+        tokens = path_tokens(url)
+        found = self.clusters.get(_join(tokens))
+        if found is None and tokens and _is_literal(tokens[-1]):
+            found = self.clusters.get(_join(_slug_last(tokens)))
+        return found
+
+    def kinds(self):
+        return Counter(cluster["kind"] for cluster in self.clusters.values())
@@ -0,0 +1,276 @@
+# warc archive storage for crawl artifacts
+# one file per page per format means millions of inodes on big crawls. here every artifact is appended
+# as a record to a rotating .warc.gz segment (sequential writes), an sqlite index keeps where it is.
+"""
+folder structure
+
+base_dir
+    warc
+        index.sqlite                                   -> (url, artifact) -> segment, offset, length
+        segments
+            crawl-20261018-120000-<pid>-00000.warc.gz
+            crawl-20261018-120000-<pid>-00001.warc.gz    (new segment every WARC_SEGMENT_MB)
+
+records of one page (WARC/1.1, every record its own gzip member so it can be read alone):
+    html        resource    text/html              rendered clean html
+    markdown    conversion  text/markdown          WARC-Refers-To the html record
+    screenshot  conversion  image/png
+    pdf         conversion  application/pdf
+    metadata    metadata    application/json       page metadata (title, description...)
+    json        metadata    application/json       full CrawlResult dump (no pdf / screenshot)
+    revisit     revisit     -                      page skipped as a duplicate (content_dedupe), points at the first one
+
+reading a page back is one seek + one gzip member:
+    with WarcStore(base_dir) as store:
+        headers, payload = store.read(url, "markdown")
+
+every process writes its own segments (pid in the name), the index is shared (WAL), so frontier
+worker processes can archive into the same base_dir.
+"""
+import os
+import json
+import time
+import gzip
+import uuid
+import base64
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+
+from CSV_Gen.capture import encode_screenshot
+from CSV_Gen.save_data import result_dump
+from CSV_Gen.settings import WARC_SEGMENT_MB
+logger = logging.getLogger("selector_discovery")
+
+# artifact -> (warc record type, content type)
+RECORD_TYPES = {
+    "html": ("resource", "text/html; charset=utf-8"),
+    "markdown": ("conversion", "text/markdown; charset=utf-8"),
+    "screenshot": ("conversion", "image/png"),
+    "pdf": ("conversion", "application/pdf"),
+    "metadata": ("metadata", "application/json"),
+    "json": ("metadata", "application/json")
+}
+
+
+def _warc_date():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _record_id():
+    return f"<urn:uuid:{uuid.uuid4()}>"
+
+
+def warc_record(record_type, payload, headers):
+    """one gzip-compressed WARC/1.1 record, headers without the ones computed here"""
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    digest = base64.b32encode(hashlib.sha1(payload).digest()).decode("ascii")
+    lines = [
+        "WARC/1.1",
+        f"WARC-Type: {record_type}",
+        f"WARC-Record-ID: {headers.pop('WARC-Record-ID', None) or _record_id()}",
+        f"WARC-Date: {_warc_date()}"
+    ]
+    lines += [f"{name}: {value}" for name, value in headers.items() if value is not None]
+    lines += [f"WARC-Block-Digest: sha1:{digest}", f"Content-Length: {len(payload)}"]
+    raw = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + payload + b"\r\n\r\n"
+    return gzip.compress(raw, compresslevel=6)
+
+
+def parse_record(member):
+    """(headers, payload) of one gzip member read back from a segment"""
+    raw = gzip.decompress(member)
+    head, _, rest = raw.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("utf-8").split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    length = int(headers.get("Content-Length", len(rest)))
+    return headers, rest[:length]
+
+
+class WarcStore:
+    """
+    store = WarcStore(base_dir)
+    store.save_result(crawl_result)       -> every artifact of the page, one index transaction
+    store.read(url, "html")               -> (headers, payload bytes) or None
+    store.close()
+
+    thread safe: records are compressed by the calling thread, only the append + index write is locked
+    """
+
+    def __init__(self, base_dir, segment_mb=WARC_SEGMENT_MB, prefix="crawl"):
+        self.root = Path(base_dir) / "warc"
+        self.segment_dir = self.root / "segments"
+        self.segment_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(segment_mb) * 1024 * 1024
+        self.prefix = prefix
+
+        self.db = sqlite3.connect(self.root / "index.sqlite", timeout=60, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                url TEXT NOT NULL,
+                artifact TEXT NOT NULL,
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                record_id TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (url, artifact)
+            )
+        """)
+        self.db.commit()
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = None
+        self._sequence = 0
+        self._started = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        name = f"{self.prefix}-{self._started}-{os.getpid()}-{self._sequence:05d}.warc.gz"
+        self._sequence += 1
+        self._segment = name
+        self._file = open(self.segment_dir / name, "ab")
+        info = json.dumps({"software": "Universal_Scraper", "format": "WARC File Format 1.1"}).encode("utf-8")
+        self._file.write(warc_record("warcinfo", info, {"WARC-Filename": name, "Content-Type": "application/json"}))
+
+    def _append(self, members):
+        # caller holds the lock. a page never spans two segments
+        if self._file is None or self._file.tell() >= self.max_bytes:
+            self._open_segment()
+        placed = []
+        for member in members:
+            offset = self._file.tell()
+            self._file.write(member)
+            placed.append((self._segment, offset, len(member)))
+        # data reaches the file before the index points at it
+        self._file.flush()
+        return placed
+
+    def write_artifacts(self, url, artifacts, content_types=None):
+        """
+        artifacts -> {artifact: payload (str / bytes)}, empty payloads are skipped
+        content_types -> {artifact: content type} where it differs from RECORD_TYPES (re-encoded screenshots)
+        """
+        content_types = content_types or {}
+        artifacts = {name: payload for name, payload in artifacts.items() if payload}
+        if not artifacts:
+            return 0
+        html_id = _record_id()
+        concurrent = html_id if "html" in artifacts else None
+
+        records, members = [], []
+        for name, payload in artifacts.items():
+            record_type, content_type = RECORD_TYPES[name]
+            content_type = content_types.get(name, content_type)
+            record_id = html_id if name == "html" else _record_id()
+            headers = {
+                "WARC-Record-ID": record_id,
+                "WARC-Target-URI": url,
+                "Content-Type": content_type,
+                "WARC-Refers-To": concurrent if record_type == "conversion" else None,
+                "WARC-Concurrent-To": concurrent if record_type == "metadata" else None,
+                "WARC-Artifact": name
+            }
+            records.append((name, record_id))
+            members.append(warc_record(record_type, payload, headers))
+
+        now = time.time()
+        with self._lock:
+            placed = self._append(members)
+            self.db.executemany(
+                "INSERT OR REPLACE INTO records (url, artifact, segment, offset, length, record_id, saved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(url, name, segment, offset, length, record_id, now)
+                 for (name, record_id), (segment, offset, length) in zip(records, placed)]
+            )
+            self.db.commit()
+        return len(members)
+
+    def write_revisit(self, url, original, match, distance=0):
+        """revisit record for a page skipped as a duplicate of `original` (no payload stored)"""
+        profile = ("http://netpreserve.org/warc/1.1/revisit/identical-payload-digest" if match == "exact"
+                   else "urn:universal-scraper:near-duplicate")
+        with self._lock:
+            row = self.db.execute(
+                "SELECT record_id FROM records WHERE url = ? AND artifact = 'html'", (original,)
+            ).fetchone()
+        record_id = _record_id()
+        member = warc_record("revisit", b"", {
+            "WARC-Record-ID": record_id,
+            "WARC-Target-URI": url,
+            "WARC-Profile": profile,
+            "WARC-Refers-To": row[0] if row else None,
+            "WARC-Refers-To-Target-URI": original,
+            "WARC-Duplicate-Distance": str(distance)
+        })
+        with self._lock:
+            (segment, offset, length), = self._append([member])
+            self.db.execute(
+                "INSERT OR REPLACE INTO records (url, artifact, segment, offset, length, record_id, saved_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, "revisit", segment, offset, length, record_id, time.time())
+            )
+            self.db.commit()
+
+    def save_result(self, result, pdf=True, screenshot=True, html=True):
+        """same artifacts save_data.save_crawl_result writes as files"""
+        screenshot_bytes, content_types = None, {}
+        if screenshot and result.screenshot:
+            encoded = encode_screenshot(result.screenshot)
+            if encoded is None:
+                logger.error(f"Failed to decode screenshot for {result.url}")
+            else:
+                screenshot_bytes, _, content_types["screenshot"] = encoded
+        meta = json.dumps(result.metadata, indent=2) if result.metadata else None
+        dump = json.dumps(result_dump(result, html), ensure_ascii=False, default=str)
+        return self.write_artifacts(result.url, {
+            "html": result.cleaned_html if html else None,
+            "markdown": str(result.markdown) if result.markdown else None,
+            "screenshot": screenshot_bytes,
+            "pdf": result.pdf if pdf else None,
+            "metadata": meta,
+            "json": dump
+        }, content_types)
+
+    def locate(self, url, artifact="html"):
+        with self._lock:
+            return self.db.execute(
+                "SELECT segment, offset, length FROM records WHERE url = ? AND artifact = ?", (url, artifact)
+            ).fetchone()
+
+    def read(self, url, artifact="html"):
+        found = self.locate(url, artifact)
+        if found is None:
+            return None
+        segment, offset, length = found
+        with open(self.segment_dir / segment, "rb") as f:
+            f.seek(offset)
+            member = f.read(length)
+        return parse_record(member)
+
+    def urls(self, artifact="html"):
+        with self._lock:
+            return [row[0] for row in self.db.execute("SELECT url FROM records WHERE artifact = ?", (artifact,))]
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.db.close()
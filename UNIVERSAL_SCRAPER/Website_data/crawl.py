@@ -11,7 +11,17 @@ crawl->
         Links.json
         Screenshots
 
+every crawl runs in stream mode: each page is handed to a background ArtifactSink as soon as crawl4ai
+yields it and dropped once written, so memory doesn't grow with max_pages and the first files show up
+while the crawl is still running
 
+what is rendered and saved per page is a capture profile (text / html / visual, CSV_Gen/capture.py) picked
+per run, screenshots + pdfs can be limited to a url pattern or a sample of pages. without one every crawl
+mode renders with its own options (breadth: screenshot + pdf, depth: none, best: full page visuals,
+site crawl: none)
+
+CRAWL_STORAGE=warc appends the pages to rotating base_dir/warc/segments/*.warc.gz files with an sqlite
+index (CSV_Gen/warc_store.py) instead of six small files per page
 """
 
 import asyncio
@@ -21,9 +31,58 @@ from crawl4ai.content_scraping_strategy import LXMLWebScrapingStrategy
 from crawl4ai.deep_crawling.scorers import KeywordRelevanceScorer
 import urllib
 import base64
-from CSV_Gen.save_data import html_default, markdown_collection,pdf_data,screenshot_data,metadata_data,json_data
+from CSV_Gen.artifact_sink import ArtifactSink
+from CSV_Gen.capture import CapturePlan, PROFILES
+from CSV_Gen.rate_limit import crawl_delay
+from CSV_Gen.settings import CRAWL_MEAN_DELAY, CRAWL_MAX_RANGE, CRAWL_CONCURRENCY, FRONTIER_WORKERS, CAPTURE_PROFILE
+from Website_data.frontier import frontier_crawl
+
+def crawl_main(url,base_dir,profile=None):
+
+    # politeness for every deep crawl: robots.txt rules, Crawl-delay of the site (cached per domain) as
+    # the minimum spacing, crawl4ai's rate limiter backs off on 429 / 503 and speeds up again on success
+    delay = max(crawl_delay(url), CRAWL_MEAN_DELAY)
+    polite = dict(
+        check_robots_txt=True,
+        mean_delay=delay,
+        max_range=CRAWL_MAX_RANGE,
+        semaphore_count=CRAWL_CONCURRENCY,
+        stream=True
+    )
+    plan = CapturePlan(profile or CAPTURE_PROFILE)
 
-def crawl_main(url,base_dir):
+    async def capture_visual(crawler, result, mode):
+        # limited visuals: the crawl rendered without them, picked pages get a visual render
+        await asyncio.sleep(delay)
+        visual_cfg = CrawlerRunConfig(
+            check_robots_txt=True,
+            scraping_strategy=LXMLWebScrapingStrategy(),
+            **plan.visual_options(mode)
+        )
+        visual = await crawler.arun(result.url, config=visual_cfg)
+        if visual.success:
+            result.screenshot, result.pdf = visual.screenshot, visual.pdf
+        else:
+            print(f"Visual capture failed {result.url}: {visual.error_message}")
+
+    async def stream_results(crawler, config, mode):
+        # results go to background writers, the crawl only waits when the writer queue is full
+        crawled = failed = 0
+        print(f"Capture profile: {plan.describe()}")
+        async with ArtifactSink(base_dir, pdf=plan.pdf, screenshot=plan.screenshot, html=plan.html) as sink:
+            async for result in await crawler.arun(url, config=config):
+                if not result.success:
+                    failed += 1
+                    print(f"Failed {result.url}: {result.error_message}")
+                    continue
+                if plan.lazy(mode) and plan.wants_visual(result.url, mode):
+                    await capture_visual(crawler, result, mode)
+                await sink.put(result)
+                crawled += 1
+                print(f"Crawled {crawled}: {result.url}")
+        duplicates = dict(sink.duplicates.duplicates) if sink.duplicates is not None else {}
+        print(f"Crawled {crawled} pages in total ({failed} failed, {sink.written} saved, duplicates: {duplicates})")
+        return crawled
 
 
     async def breadth_crawl():
@@ -34,19 +93,16 @@ def crawl_main(url,base_dir):
                 max_pages=2,
                 score_threshold=0.3,
                 ),
-                screenshot=True,
-                pdf=True,
+                **plan.crawl_options("breadth"),
 
                 scraping_strategy=LXMLWebScrapingStrategy(),
                 verbose=True,
-                check_robots_txt=False
+                **polite
 
             )
 
         async with AsyncWebCrawler() as crawler:
-            results = await crawler.arun(url, config=config)
-            
-            print(f"Crawled {len(results)} pages in total")
+            await stream_results(crawler, config, "breadth")
 
     async def depth_crawl():
         config = CrawlerRunConfig(
@@ -57,14 +113,13 @@ def crawl_main(url,base_dir):
             include_external=False
         ),
         scraping_strategy=LXMLWebScrapingStrategy(),
-        verbose=True
+        verbose=True,
+        **plan.crawl_options("depth"),
+        **polite
     )
 
         async with AsyncWebCrawler() as crawler:
-            results = await crawler.arun(url, config=config)
-
-            print(f"Crawled {len(results)} pages in total")
-            print(results)
+            await stream_results(crawler, config, "depth")
 
     async def best_crawl(url,keywords):
         """
@@ -98,11 +153,8 @@ def crawl_main(url,base_dir):
             ),
             scraping_strategy=LXMLWebScrapingStrategy(),
             verbose=True,
-            check_robots_txt=False,
-            pdf=True,
-            screenshot=True,
-            scan_full_page=True,
-            wait_for_images=True
+            **polite,
+            **plan.crawl_options("best")
             # page_timeout=
             
             
@@ -110,27 +162,15 @@ def crawl_main(url,base_dir):
         )
 
         async with AsyncWebCrawler() as crawler:
-            results = await crawler.arun(url, config=configs)
-            for r in results:
-                urls_data = r.url
-                html = r.cleaned_html
-                md = r.markdown 
-                json_txt = r.model_dump(exclude={'pdf', 'screenshot'})
-                meta = r.metadata
-                pdf_str = r.pdf
-                screenshot_str=r.screenshot
-                html_default(urls_data,base_dir,html)
-                markdown_collection(urls_data,base_dir,md)
-                pdf_data(urls_data,base_dir,pdf_str)
-                metadata_data(urls_data,base_dir,meta)
-                json_data(urls_data,base_dir,json_txt)
-                screenshot_data(urls_data, base_dir,screenshot_str)
-
-            print(f"Crawled {len(results)} pages in total")
+            await stream_results(crawler, configs, "best")
 
 
     while True:
-        crawl = int(input("1) breadth_crawl\n2) depth_crawl\n3) best_crawl"))
+        crawl = int(input("1) breadth_crawl\n2) depth_crawl\n3) best_crawl\n4) site crawl (multi-process, resumable)"))
+        if crawl in (1, 2, 3, 4) and profile is None:
+            chosen = input(f"Capture profile {' / '.join(PROFILES)} [default: {plan.describe()}]: ").strip()
+            if chosen:
+                plan = CapturePlan(chosen)
         if crawl == 1:
             asyncio.run(breadth_crawl())
             break
@@ -141,9 +181,23 @@ def crawl_main(url,base_dir):
             keywords = input("").split()
             asyncio.run(best_crawl(url,keywords))
             break
+        elif crawl == 4:
+            # whole site on a disk frontier (base_dir/crawl), several worker processes, resumes on restart
+            workers = input(f"Worker processes [default: {FRONTIER_WORKERS}]: ").strip()
+            max_pages = input("Max pages, 0 = whole site [default: 0]: ").strip()
+            keywords = input("Keywords for best-first order (optional): ").split()
+            frontier_crawl(
+                url, base_dir,
+                workers=int(workers) if workers else FRONTIER_WORKERS,
+                max_pages=int(max_pages) if max_pages else 0,
+                keywords=keywords or None,
+                profile=plan.name
+            )
+            break
     
     
 
-crawl_main(url="https://www.samsung.com/",base_dir="/mnt/c/Users/Aryan/Desktop/Pristine-Forrest/scraping/PF-SCRAPED-DATA/New_data_organised")
+if __name__ == "__main__":
+    crawl_main(url="https://www.samsung.com/",base_dir="/mnt/c/Users/Aryan/Desktop/Pristine-Forrest/scraping/PF-SCRAPED-DATA/New_data_organised")
 
 # https://www.websitecrawler.org/
\ No newline at end of file
@@ -0,0 +1,385 @@
+"""
+Disk-backed url frontier for site-wide crawls
+
+crawl4ai's deep crawl strategies keep the queue in memory inside one process. Here the queue is a
+sqlite file (WAL) that several local worker processes lease urls from, so a crawl uses every core and
+a restarted crawl continues where it stopped.
+
+folder structure
+base_dir
+    crawl
+        frontier_<domain>.sqlite
+
+urls table -> url, fetch_url, depth, score, status (queued / leased / done / failed), lease owner + expiry, attempts
+    - url is the canonical form (url_canon) and only a key, pages are fetched under fetch_url, the first
+      spelling the site linked
+    - lease(): a worker takes the best queued urls (score desc, depth asc) for lease_seconds
+    - a lease that expires (worker died) is handed out again, or marked failed once out of attempts
+    - a page is done once its artifacts are written (ArtifactSink on_saved), not when they are queued
+    - links found on a page are pushed with depth + 1, urls whose canonical form is already in the
+      table are ignored. each worker keeps a compact seen-set of what it pushed, so a link repeated on
+      every page (menus, footers) costs one table lookup per worker instead of one per page
+
+hosts table -> host, next_allowed
+    - Crawl-delay / throttle spacing of a host is shared by every worker process: each request start
+      is reserved here (reserve_host), so N workers together keep the spacing one crawler would
+"""
+import os
+import time
+import socket
+import sqlite3
+import asyncio
+import threading
+import logging
+import multiprocessing
+from pathlib import Path
+from urllib.parse import urlparse
+
+from crawl4ai import CrawlerRunConfig, CacheMode
+from crawl4ai.deep_crawling.scorers import KeywordRelevanceScorer
+
+from CSV_Gen.browser_pool import BrowserPool
+from CSV_Gen.rate_limit import RateLimiter
+from CSV_Gen.artifact_sink import ArtifactSink
+from CSV_Gen.capture import CapturePlan
+from CSV_Gen.url_canon import canonical_url, unique_urls, UrlSeen
+from CSV_Gen.settings import (
+    FRONTIER_WORKERS, FRONTIER_POOL_SIZE, FRONTIER_BATCH, FRONTIER_LEASE_SECONDS, FRONTIER_MAX_ATTEMPTS,
+    SCRAPE_PER_HOST, CAPTURE_PROFILE
+)
+logger = logging.getLogger("selector_discovery")
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SKIP_EXTENSIONS = (
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".svg", ".ico", ".pdf", ".zip", ".gz", ".rar", ".mp4", ".mp3",
+    ".avi", ".mov", ".css", ".js", ".xml", ".json", ".woff", ".woff2", ".ttf", ".exe", ".dmg"
+)
+
+
+def frontier_path(base_dir, url):
+    domain = urlparse(url).hostname or "unknown"
+    return Path(base_dir) / "crawl" / f"frontier_{domain}.sqlite"
+
+
+class Frontier:
+    """
+    frontier = Frontier(path)
+    frontier.add([(url, depth, score, parent), ...])
+    batch = frontier.lease(worker_id, 20)      -> [(url to fetch, depth, score), ...]
+    frontier.done(url) / frontier.failed(url, error)
+
+    one connection per process, every write is its own short IMMEDIATE transaction. calls block (a write
+    waits for the other processes' transactions), async code runs them with asyncio.to_thread and a lock
+    keeps those threads on the connection one at a time
+    """
+
+    def __init__(self, path, lease_seconds=FRONTIER_LEASE_SECONDS, max_attempts=FRONTIER_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                fetch_url TEXT,
+                depth INTEGER NOT NULL,
+                score REAL NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                parent TEXT,
+                lease_owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(urls)")}
+        if "fetch_url" not in columns:
+            # frontier of an earlier version, its urls are fetched as stored
+            self.db.execute("ALTER TABLE urls ADD COLUMN fetch_url TEXT")
+        self.db.execute("CREATE INDEX IF NOT EXISTS urls_next ON urls (status, score DESC, depth)")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS hosts (
+                host TEXT PRIMARY KEY,
+                next_allowed REAL NOT NULL
+            )
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, fn):
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+                self.db.execute("COMMIT")
+                return result
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self.db.execute(sql, params).fetchall()
+
+    def add(self, entries):
+        """entries -> (url, depth, score, parent), returns how many were new (by canonical url)"""
+        now = time.time()
+        rows = [(canonical_url(url), url, depth, score, QUEUED, parent, now) for url, depth, score, parent in entries]
+        if not rows:
+            return 0
+
+        def insert():
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO urls (url, fetch_url, depth, score, status, parent, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            return self.db.total_changes - before
+
+        return self._write(insert)
+
+    def lease(self, owner, limit):
+        now = time.time()
+
+        def take():
+            # leases that expired on their last attempt are not handed out again, they failed
+            self.db.execute(
+                "UPDATE urls SET status = ?, lease_owner = NULL, last_error = ?, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, "lease expired", now, LEASED, now, self.max_attempts)
+            )
+            rows = self.db.execute("""
+                SELECT url, COALESCE(fetch_url, url), depth, score FROM urls
+                WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND attempts < ?
+                ORDER BY score DESC, depth ASC, rowid ASC
+                LIMIT ?
+            """, (QUEUED, LEASED, now, self.max_attempts, limit)).fetchall()
+            self.db.executemany(
+                "UPDATE urls SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE url = ?",
+                [(LEASED, owner, now + self.lease_seconds, now, key) for key, _, _, _ in rows]
+            )
+            return [(url, depth, score) for _, url, depth, score in rows]
+
+        return self._write(take)
+
+    def reserve_host(self, host, interval):
+        """seconds to wait before the next request to host may start, the start is reserved for the caller"""
+        now = time.time()
+
+        def reserve():
+            row = self.db.execute("SELECT next_allowed FROM hosts WHERE host = ?", (host,)).fetchone()
+            start = max(now, row[0]) if row else now
+            self.db.execute(
+                "INSERT INTO hosts (host, next_allowed) VALUES (?, ?) "
+                "ON CONFLICT(host) DO UPDATE SET next_allowed = excluded.next_allowed",
+                (host, start + interval)
+            )
+            return start - now
+
+        return self._write(reserve)
+
+    def done(self, url):
+        self._write(lambda: self.db.execute(
+            "UPDATE urls SET status = ?, lease_owner = NULL, last_error = NULL, updated_at = ? WHERE url = ?",
+            (DONE, time.time(), canonical_url(url))
+        ))
+
+    def failed(self, url, error):
+        # back in the queue until it ran out of attempts
+        self._write(lambda: self.db.execute(
+            "UPDATE urls SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, lease_owner = NULL, "
+            "last_error = ?, updated_at = ? WHERE url = ?",
+            (self.max_attempts, FAILED, QUEUED, str(error)[:500], time.time(), canonical_url(url))
+        ))
+
+    def release(self, owner):
+        """unfinished leases of a worker go back to the queue (clean shutdown)"""
+        self._write(lambda: self.db.execute(
+            "UPDATE urls SET status = ?, lease_owner = NULL, attempts = MAX(attempts - 1, 0) "
+            "WHERE status = ? AND lease_owner = ?",
+            (QUEUED, LEASED, owner)
+        ))
+
+    def counts(self):
+        return dict(self._read("SELECT status, COUNT(*) FROM urls GROUP BY status"))
+
+    def pending(self):
+        """urls still queued or leased (a lease may still produce new links), expired last attempts excluded"""
+        return self._read(
+            "SELECT COUNT(*) FROM urls WHERE (status = ? AND (lease_expires >= ? OR attempts < ?)) "
+            "OR (status = ? AND attempts < ?)",
+            (LEASED, time.time(), self.max_attempts, QUEUED, self.max_attempts)
+        )[0][0]
+
+    def done_count(self):
+        return self._read("SELECT COUNT(*) FROM urls WHERE status = ?", (DONE,))[0][0]
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+def page_links(result, root_host, include_external=False):
+    """crawlable links of a crawl result, deduped on their canonical form"""
+    links = []
+    groups = ["internal", "external"] if include_external else ["internal"]
+    for group in groups:
+        for link in (result.links or {}).get(group, []):
+            href = link.get("href") if isinstance(link, dict) else link
+            if not href:
+                continue
+            parsed = urlparse(href)
+            if parsed.scheme not in ("http", "https"):
+                continue
+            if not include_external and parsed.hostname != root_host:
+                continue
+            if parsed.path.lower().endswith(SKIP_EXTENSIONS):
+                continue
+            links.append(href)
+    return unique_urls(links)
+
+
+async def _worker_loop(frontier, owner, root_url, base_dir, max_depth, max_pages, keywords,
+                       include_external, pool_size, per_host, profile):
+    root_host = urlparse(root_url).hostname
+    scorer = KeywordRelevanceScorer(keywords=keywords, weight=0.7) if keywords else None
+    # pages are rendered one by one here, so visual pages of a limited profile are picked up front
+    plan = CapturePlan(profile)
+    run_cfg = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, check_robots_txt=True, **plan.crawl_options("frontier"))
+    visual_cfg = CrawlerRunConfig(cache_mode=CacheMode.BYPASS, check_robots_txt=True,
+                                  **plan.visual_options("frontier"))
+    # concurrency is this worker's share of per_host, request spacing is reserved in the frontier
+    limiter = RateLimiter(per_host, spacing=frontier.reserve_host)
+    # links this worker already pushed (or leased), the table ignores them anyway
+    pushed = UrlSeen()
+    crawled = 0
+
+    async def crawl_one(url, depth):
+        try:
+            config = visual_cfg if plan.wants_visual(url, "frontier") else run_cfg
+            result = await pool.arun(url, config=config)
+        except Exception as e:
+            await asyncio.to_thread(frontier.failed, url, e)
+            return False
+        if not result or not result.success:
+            await asyncio.to_thread(frontier.failed, url, getattr(result, "error_message", None) or "crawl failed")
+            return False
+
+        if depth < max_depth:
+            found = [link for link in page_links(result, root_host, include_external)
+                     if pushed.add(link)]
+            await asyncio.to_thread(
+                frontier.add, [(link, depth + 1, scorer.score(link) if scorer else 0.0, url) for link in found]
+            )
+        # done / failed once the write finished (saved)
+        await sink.put(result, key=url)
+        return True
+
+    def saved(url, ok):
+        # runs on the sink's writer thread, the frontier write stays off the event loop
+        if ok:
+            frontier.done(url)
+        else:
+            frontier.failed(url, "saving artifacts failed")
+
+    # the sink is drained before the worker exits, every saved page is marked before the lease is released
+    async with ArtifactSink(base_dir, pdf=plan.pdf, screenshot=plan.screenshot, html=plan.html,
+                            on_saved=saved) as sink, \
+            BrowserPool(pool_size, limiter=limiter) as pool:
+        idle = 0
+        while True:
+            limit = FRONTIER_BATCH
+            if max_pages:
+                # shared budget, workers may overshoot it by at most one batch each
+                limit = min(limit, max_pages - await asyncio.to_thread(frontier.done_count))
+                if limit <= 0:
+                    break
+            batch = await asyncio.to_thread(frontier.lease, owner, limit)
+            if not batch:
+                # other workers may still push links from their leased pages
+                if await asyncio.to_thread(frontier.pending) == 0 or idle >= 30:
+                    break
+                idle += 1
+                await asyncio.sleep(2)
+                continue
+            idle = 0
+            for url, _, _ in batch:
+                pushed.add(url)
+            results = await asyncio.gather(*(crawl_one(url, depth) for url, depth, _ in batch))
+            crawled += sum(1 for ok in results if ok)
+            print(f"[{owner}] crawled {crawled} pages")
+    return crawled
+
+
+def crawl_worker(path, owner, root_url, base_dir, max_depth, max_pages, keywords, include_external,
+                 pool_size, per_host, profile=CAPTURE_PROFILE):
+    """entry point of one worker process"""
+    frontier = Frontier(path)
+    try:
+        return asyncio.run(_worker_loop(
+            frontier, owner, root_url, base_dir, max_depth, max_pages, keywords, include_external, pool_size, per_host,
+            profile
+        ))
+    finally:
+        frontier.release(owner)
+        frontier.close()
+
+
+def frontier_crawl(url, base_dir, workers=FRONTIER_WORKERS, max_depth=20, max_pages=0, keywords=None,
+                   include_external=False, pool_size=FRONTIER_POOL_SIZE, per_host=SCRAPE_PER_HOST,
+                   profile=CAPTURE_PROFILE):
+    """
+    site-wide crawl of url with `workers` processes on one frontier.
+    max_pages -> pages crawled in total (done in the frontier), 0 = until the frontier is empty
+    keywords  -> urls scored with KeywordRelevanceScorer and crawled best first, else breadth first
+    profile   -> capture profile (capture.py), what every page is rendered and saved with
+    running it again on the same url resumes the crawl
+    """
+    url = url.strip()
+    path = frontier_path(base_dir, url)
+    with Frontier(path) as frontier:
+        frontier.add([(url, 0, 1.0, None)])
+        print(f"Frontier {path}: {frontier.counts()}")
+
+    # fork when the platform has it: the interactive entry scripts are not import-safe for spawn,
+    # and nothing has started threads yet at this point
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    # requests in flight per host are split between the workers, their spacing is shared (hosts table)
+    worker_per_host = max(1, per_host // max(1, workers))
+    host = socket.gethostname()
+    processes = []
+    for number in range(max(1, workers)):
+        owner = f"{host}-{os.getpid()}-{number}"
+        process = ctx.Process(
+            target=crawl_worker,
+            args=(path, owner, url, base_dir, max_depth, max_pages, keywords, include_external,
+                  pool_size, worker_per_host, profile),
+            name=f"crawl-worker-{number}"
+        )
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
+
+    with Frontier(path) as frontier:
+        counts = frontier.counts()
+    print(f"Frontier crawl finished: {counts}")
+    return counts